@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OncologyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'oncology'
+
+    def ready(self):
+        from oncology import signals  # noqa: F401
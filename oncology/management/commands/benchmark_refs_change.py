@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import date
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from oncology.models import Doctor, Patient, PatientTests, Test, Analysis, Indicator, TestRatio
+from oncology.services.analysis_service import PANEL_RATIOS, get_analysis_values, get_panel_ratios
+from oncology.services.indicator_service import get_default_refs, reset_indicators_registry
+from oncology.services.result_service import get_analysis_result, change_refs, ABNORMAL_CONCLUSION
+
+
+BENCHMARK_PANEL = "cytokine_status"
+BENCHMARK_DIAGNOSIS = "benchmark"
+BENCHMARK_INDICATORS = [
+    ("cd3_il2_stimulated", "cd3_il2_spontaneous"),
+    ("cd3_tnfa_stimulated", "cd3_tnfa_spontaneous"),
+    ("cd3_ifny_stimulated", "cd3_ifny_spontaneous"),
+]
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Замеряет пересчёт заключений при изменении реф. значений: по одному тесту (как раньше) " \
+           "и порциями (change_refs). Тестовые данные создаются в транзакции и откатываются"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tests", type=int, nargs="+", default=[10000, 100000],
+                            help="Количество тестов цитокинового статуса в когорте")
+        parser.add_argument("--tests-per-patient", type=int, default=10, help="Тестов на одного пациента")
+        parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора случайных чисел")
+
+    def handle(self, *args, **options):
+        for tests_count in options["tests"]:
+            try:
+                with transaction.atomic():
+                    self.run_benchmark(tests_count, options["tests_per_patient"], random.Random(options["seed"]))
+                    transaction.set_rollback(True)
+            finally:
+                reset_indicators_registry()
+
+    def run_benchmark(self, tests_count, tests_per_patient, rng):
+        started = time.perf_counter()
+        tests = self.seed_tests(tests_count, tests_per_patient, rng)
+        self.stdout.write(f"Тестов: {tests_count}, подготовка данных: {time.perf_counter() - started:.1f} с")
+
+        min_refs, max_refs = get_default_refs(BENCHMARK_PANEL)
+        request_data = {}
+        for (name, _, _), min_ref, max_ref in zip(PANEL_RATIOS[BENCHMARK_PANEL], min_refs, max_refs):
+            request_data[f"{name}_min"] = min_ref
+            request_data[f"{name}_max"] = max_ref
+
+        Test.objects.filter(id__in=[test.id for test in tests]).update(conclusion=None)
+        started = time.perf_counter()
+        for test in tests:
+            values = get_panel_ratios(get_analysis_values(test.patient_test_id_id), BENCHMARK_PANEL)
+            get_analysis_result(test, values, min_refs, max_refs)
+        self.stdout.write(f"  по одному тесту: {time.perf_counter() - started:.2f} с, "
+                          f"с отклонениями: {self.count_abnormal(tests)}")
+
+        Test.objects.filter(id__in=[test.id for test in tests]).update(conclusion=None)
+        started = time.perf_counter()
+        change_refs(tests[0], BENCHMARK_PANEL, request_data)
+        self.stdout.write(f"  change_refs порциями: {time.perf_counter() - started:.2f} с, "
+                          f"с отклонениями: {self.count_abnormal(tests)}")
+
+    def count_abnormal(self, tests):
+        return Test.objects.filter(id__in=[test.id for test in tests], conclusion=ABNORMAL_CONCLUSION).count()
+
+    def seed_tests(self, tests_count, tests_per_patient, rng):
+        indicators = {name: Indicator.objects.get_or_create(name=name, defaults={"unit": "%"})[0]
+                      for names in BENCHMARK_INDICATORS for name in names}
+        reset_indicators_registry()
+
+        now = timezone.now()
+        doctor = Doctor.objects.create_user("Бенчмарк", "Бенчмарк", "Бенчмарк", "benchmark",
+                                            f"benchmark-{time.time_ns()}@example.com")
+        patients = Patient.objects.bulk_create(
+            [Patient(first_name="Иван", last_name=f"Пациент{i}", patronymic="Иванович", birth_date=date(1970, 1, 1),
+                     diagnosis=BENCHMARK_DIAGNOSIS, region="Свердловская")
+             for i in range(-(-tests_count // tests_per_patient))], batch_size=BATCH_SIZE)
+        patient_tests = PatientTests.objects.bulk_create(
+            [PatientTests(analysis_date=date(2024, 1, 1), created_at=now, updated_at=now, doctor_id=doctor,
+                          patient_id=patients[i // tests_per_patient]) for i in range(tests_count)],
+            batch_size=BATCH_SIZE)
+        tests = Test.objects.bulk_create(
+            [Test(name=BENCHMARK_PANEL, patient_test_id=patient_test) for patient_test in patient_tests],
+            batch_size=BATCH_SIZE)
+
+        analysises = []
+        test_ratios = []
+        for test in tests:
+            values = {}
+            for stimulated, spontaneous in BENCHMARK_INDICATORS:
+                values[stimulated] = Decimal(rng.randint(2000, 9999)) / 100
+                values[spontaneous] = round(values[stimulated] / Decimal(rng.uniform(70, 130)), 2)
+            analysises += [Analysis(value=value, indicator_id=indicators[name], test_id=test)
+                           for name, value in values.items()]
+            ratios = get_panel_ratios({BENCHMARK_PANEL: values}, BENCHMARK_PANEL)
+            test_ratios += [TestRatio(test_id=test, test_name=BENCHMARK_PANEL, name=name, value=value)
+                            for (name, _, _), value in zip(PANEL_RATIOS[BENCHMARK_PANEL], ratios)]
+        Analysis.objects.bulk_create(analysises, batch_size=BATCH_SIZE)
+        TestRatio.objects.bulk_create(test_ratios, batch_size=BATCH_SIZE)
+
+        return tests
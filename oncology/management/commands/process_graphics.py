@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from oncology.models import PatientTests
+from oncology.services.graphic_job_service import process_patient_tests_graphics, get_claimable_filter
+
+
+class Command(BaseCommand):
+    help = "Строит графики для анализов, ожидающих отрисовки (очередь в таблице PatientTests). " \
+           "Анализы, зависшие в статусе processing дольше GRAPHIC_CLAIM_TIMEOUT, обрабатываются повторно"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Обработать очередь один раз и завершиться")
+        parser.add_argument("--retry-failed", action="store_true", help="Повторить построение упавших графиков")
+        parser.add_argument("--interval", type=float, default=2.0, help="Пауза между опросами очереди, сек.")
+
+    def handle(self, *args, **options):
+        statuses = ["pending"]
+        if options["retry_failed"]:
+            statuses.append("failed")
+
+        while True:
+            patient_test_ids = list(PatientTests.objects.filter(get_claimable_filter(statuses))
+                                    .order_by("id").values_list("id", flat=True))
+            for patient_test_id in patient_test_ids:
+                process_patient_tests_graphics(patient_test_id, statuses)
+            if patient_test_ids:
+                self.stdout.write(f"Обработано анализов: {len(patient_test_ids)}")
+
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
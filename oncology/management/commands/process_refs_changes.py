@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from oncology.models import RefsChangeJob
+from oncology.services.refs_job_service import process_refs_change_job, get_claimable_filter
+
+
+class Command(BaseCommand):
+    help = "Выполняет ожидающие задания на изменение реф. значений (очередь в таблице RefsChangeJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Обработать очередь один раз и завершиться")
+        parser.add_argument("--retry-failed", action="store_true",
+                            help="Продолжить упавшие задания с последней сохранённой порции")
+        parser.add_argument("--interval", type=float, default=2.0, help="Пауза между опросами очереди, сек.")
+
+    def handle(self, *args, **options):
+        statuses = ["pending"]
+        if options["retry_failed"]:
+            statuses.append("failed")
+
+        while True:
+            job_ids = list(RefsChangeJob.objects.filter(get_claimable_filter(statuses))
+                           .order_by("id").values_list("id", flat=True))
+            for job_id in job_ids:
+                process_refs_change_job(job_id, statuses)
+            if job_ids:
+                self.stdout.write(f"Обработано заданий: {len(job_ids)}")
+
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
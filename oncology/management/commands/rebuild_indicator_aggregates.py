@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from oncology.models import IndicatorAggregate
+from oncology.services.aggregate_service import rebuild_indicator_aggregates
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты показателей пациентов (таблица IndicatorAggregate) по всем анализам"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_indicator_aggregates()
+        self.stdout.write(f"Пересчитано агрегатов: {IndicatorAggregate.objects.count()}")
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from oncology.services.graphic_service import sweep_orphan_graphic_files
+
+
+class Command(BaseCommand):
+    help = "Удаляет из S3 файлы графиков, на которые дольше GRAPHIC_FILES_GRACE_PERIOD не ссылается ни один Graphic"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Выполнить очистку один раз и завершиться")
+        parser.add_argument("--interval", type=float, default=600.0, help="Пауза между очистками, сек.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep_orphan_graphic_files()
+            if deleted:
+                self.stdout.write(f"Удалено файлов: {deleted}")
+
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
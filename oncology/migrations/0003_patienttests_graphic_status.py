@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0002_patient_chemoterapy_patient_diagnosis_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patienttests',
+            name='graphic_status',
+            field=models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0003_patienttests_graphic_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphic',
+            name='input_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:11
+
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def reset_graphic_sequence(apps, schema_editor):
+    Graphic = apps.get_model("oncology", "Graphic")
+    for sql in schema_editor.connection.ops.sequence_reset_sql(no_style(), [Graphic]):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0004_graphic_input_hash'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='graphic',
+            constraint=models.UniqueConstraint(fields=('patient_test_id', 'input_hash'), name='unique_patient_test_graphic'),
+        ),
+        migrations.RunPython(reset_graphic_sequence, migrations.RunPython.noop),
+    ]
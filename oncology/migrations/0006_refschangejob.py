@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0005_graphic_unique_patient_test_graphic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefsChangeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refs', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=255)),
+                ('total', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('last_test_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor_id', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+                ('test_id', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='oncology.test')),
+            ],
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+PANEL_RATIOS = {
+    "regeneration_type": [
+        ("lymf_mon", ("regeneration_type", "lymphocytes"), ("regeneration_type", "monocytes")),
+        ("neu_lymf", ("regeneration_type", "neutrophils"), ("regeneration_type", "lymphocytes")),
+        ("neu_mon", ("regeneration_type", "neutrophils"), ("regeneration_type", "monocytes")),
+    ],
+    "hematological_research": [
+        ("cd19_cd4", ("immune_status", "b_lymphocytes"), ("immune_status", "t_helpers")),
+        ("lymf_cd19", ("hematological_research", "lymphocytes"), ("immune_status", "b_lymphocytes")),
+        ("neu_lymf", ("hematological_research", "neutrophils"), ("hematological_research", "lymphocytes")),
+        ("cd19_cd8", ("immune_status", "b_lymphocytes"), ("immune_status", "t_cytotoxic_lymphocytes")),
+    ],
+    "immune_status": [
+        ("neu_cd4", ("hematological_research", "neutrophils"), ("immune_status", "t_helpers")),
+        ("neu_cd3", ("hematological_research", "neutrophils"), ("immune_status", "t_lymphocytes")),
+        ("neu_lymf", ("hematological_research", "neutrophils"), ("hematological_research", "lymphocytes")),
+        ("neu_cd8", ("hematological_research", "neutrophils"), ("immune_status", "t_cytotoxic_lymphocytes")),
+    ],
+    "cytokine_status": [
+        ("cd3_il2", ("cytokine_status", "cd3_il2_stimulated"), ("cytokine_status", "cd3_il2_spontaneous")),
+        ("cd3_tnfa", ("cytokine_status", "cd3_tnfa_stimulated"), ("cytokine_status", "cd3_tnfa_spontaneous")),
+        ("cd3_ifny", ("cytokine_status", "cd3_ifny_stimulated"), ("cytokine_status", "cd3_ifny_spontaneous")),
+    ],
+}
+
+
+def fill_test_ratios(apps, schema_editor):
+    PatientTests = apps.get_model("oncology", "PatientTests")
+    Test = apps.get_model("oncology", "Test")
+    Analysis = apps.get_model("oncology", "Analysis")
+    TestRatio = apps.get_model("oncology", "TestRatio")
+
+    last_patient_test_id = 0
+    while True:
+        patient_test_ids = list(PatientTests.objects.filter(id__gt=last_patient_test_id).order_by("id")
+                                .values_list("id", flat=True)[:1000])
+        if not patient_test_ids:
+            return
+        last_patient_test_id = patient_test_ids[-1]
+
+        analysis_values = {}
+        analysises = Analysis.objects.filter(test_id__patient_test_id__in=patient_test_ids) \
+            .values_list("test_id__patient_test_id", "test_id__name", "indicator_id__name", "value")
+        for patient_test_id, test_name, indicator_name, value in analysises:
+            analysis_values.setdefault(patient_test_id, {}).setdefault(test_name, {})[indicator_name] = value
+
+        test_ratios = []
+        tests = Test.objects.filter(patient_test_id__in=patient_test_ids, name__in=PANEL_RATIOS) \
+            .values_list("id", "patient_test_id", "name")
+        for test_id, patient_test_id, test_name in tests:
+            values = analysis_values.get(patient_test_id, {})
+            for name, (numerator_test, numerator), (denominator_test, denominator) in PANEL_RATIOS[test_name]:
+                numerator_value = values.get(numerator_test, {}).get(numerator)
+                denominator_value = values.get(denominator_test, {}).get(denominator)
+                if numerator_value is not None and denominator_value:
+                    test_ratios.append(TestRatio(test_id_id=test_id, test_name=test_name, name=name,
+                                                 value=numerator_value / denominator_value))
+        TestRatio.objects.bulk_create(test_ratios, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0006_refschangejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestRatio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_name', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('value', models.FloatField()),
+                ('test_id', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='oncology.test')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['test_name', 'name', 'value'], name='test_ratio_value_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='testratio',
+            constraint=models.UniqueConstraint(fields=('test_id', 'name'), name='unique_test_ratio'),
+        ),
+        migrations.RunPython(fill_test_ratios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0007_testratio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortRefs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('diagnosis', models.CharField(max_length=255)),
+                ('test_name', models.CharField(max_length=255)),
+                ('min_refs', models.JSONField()),
+                ('max_refs', models.JSONField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cohortrefs',
+            constraint=models.UniqueConstraint(fields=('diagnosis', 'test_name'), name='unique_cohort_refs'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0008_cohortrefs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patienttests',
+            index=models.Index(fields=['patient_id', 'analysis_date'], name='patient_tests_date_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0009_patient_tests_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicatorAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('mean', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('min', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('max', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('last_value', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('last_date', models.DateField()),
+                ('indicator_id', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='oncology.indicator')),
+                ('patient_id', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='oncology.patient')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='indicatoraggregate',
+            constraint=models.UniqueConstraint(fields=('patient_id', 'indicator_id'), name='unique_indicator_aggregate'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0010_indicatoraggregate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'id'], name='patient_last_name_idx'),
+        ),
+    ]
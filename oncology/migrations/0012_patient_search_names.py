@@ -0,0 +1,63 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+def normalize_name(name):
+    return (name or "").strip().casefold().replace("ё", "е")
+
+
+def fill_search_names(apps, schema_editor):
+    Patient = apps.get_model("oncology", "Patient")
+
+    last_patient_id = 0
+    while True:
+        patients = list(Patient.objects.filter(id__gt=last_patient_id).order_by("id")
+                        .only("id", "first_name", "last_name", "patronymic")[:1000])
+        if not patients:
+            return
+        last_patient_id = patients[-1].id
+
+        for patient in patients:
+            patient.first_name_search = normalize_name(patient.first_name)
+            patient.last_name_search = normalize_name(patient.last_name)
+            patient.patronymic_search = normalize_name(patient.patronymic)
+        Patient.objects.bulk_update(patients, ["first_name_search", "last_name_search", "patronymic_search"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0011_patient_last_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='first_name_search',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_name_search',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='patronymic_search',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name_search'], name='patient_last_name_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['first_name_search'], name='patient_first_name_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['patronymic_search'], name='patient_patronymic_search_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
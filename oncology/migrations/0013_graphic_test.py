@@ -0,0 +1,49 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_graphic_tests(apps, schema_editor):
+    Graphic = apps.get_model("oncology", "Graphic")
+    Test = apps.get_model("oncology", "Test")
+
+    last_graphic_id = 0
+    while True:
+        graphics = list(Graphic.objects.filter(id__gt=last_graphic_id).order_by("id")[:1000])
+        if not graphics:
+            return
+        last_graphic_id = graphics[-1].id
+
+        test_ids = {}
+        tests = Test.objects.filter(patient_test_id__in={graphic.patient_test_id_id for graphic in graphics}) \
+            .order_by("id").values_list("patient_test_id", "name", "id")
+        for patient_test_id, name, test_id in tests:
+            test_ids[patient_test_id, name] = test_id
+
+        for graphic in graphics:
+            graphic.test_name = graphic.graphic.name.rsplit("/", 1)[-1].rsplit("_", 1)[0]
+            graphic.test_id_id = test_ids.get((graphic.patient_test_id_id, graphic.test_name))
+        Graphic.objects.bulk_update(graphics, ["test_name", "test_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0012_patient_search_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphic',
+            name='test_name',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='graphic',
+            name='test_id',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='oncology.test'),
+        ),
+        migrations.RunPython(fill_graphic_tests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0013_graphic_test'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patienttests',
+            name='graphic_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
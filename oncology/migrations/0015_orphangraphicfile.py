@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0014_patienttests_graphic_claimed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrphanGraphicFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graphic', models.CharField(max_length=255, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
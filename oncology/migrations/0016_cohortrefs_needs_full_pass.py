@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0015_orphangraphicfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cohortrefs',
+            name='needs_full_pass',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='refschangejob',
+            name='resolved_refs',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:27
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicate_graphics(apps, schema_editor):
+    Graphic = apps.get_model("oncology", "Graphic")
+    OrphanGraphicFile = apps.get_model("oncology", "OrphanGraphicFile")
+
+    duplicates = Graphic.objects.values("patient_test_id", "test_name").annotate(count=Count("id"), last_id=Max("id")) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        graphics = Graphic.objects.filter(patient_test_id=duplicate["patient_test_id"],
+                                          test_name=duplicate["test_name"]).exclude(id=duplicate["last_id"])
+        OrphanGraphicFile.objects.bulk_create([OrphanGraphicFile(graphic=graphic.graphic.name) for graphic in graphics],
+                                              ignore_conflicts=True)
+        graphics.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oncology', '0016_cohortrefs_needs_full_pass'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='graphic',
+            name='unique_patient_test_graphic',
+        ),
+        migrations.RunPython(delete_duplicate_graphics, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='graphic',
+            constraint=models.UniqueConstraint(fields=('patient_test_id', 'test_name'), name='unique_patient_test_graphic_name'),
+        ),
+    ]
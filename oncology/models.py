@@ -60,6 +60,34 @@ def validate_date(value):
         raise ValidationError("Дата рождения не может быть больше текущей даты")
 
 
+PATIENT_NAME_FIELDS = ("first_name", "last_name", "patronymic")
+
+
+def normalize_name(name):
+    return (name or "").strip().casefold().replace("ё", "е")
+
+
+class PatientQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for patient in objs:
+            patient.set_search_names()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        for patient in objs:
+            patient.set_search_names()
+        fields = list(fields) + [f"{field}_search" for field in PATIENT_NAME_FIELDS if field in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        for field in PATIENT_NAME_FIELDS:
+            if isinstance(kwargs.get(field), str):
+                kwargs[f"{field}_search"] = normalize_name(kwargs[field])
+        return super().update(**kwargs)
+
+
 class Patient(models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
@@ -72,14 +100,55 @@ class Patient(models.Model):
     diagnosis_comment = models.TextField(null=True, blank=True)
     operation_comment = models.TextField(null=True, blank=True)
     chemoterapy_comment = models.TextField(null=True, blank=True)
+    first_name_search = models.CharField(max_length=255, default="", editable=False)
+    last_name_search = models.CharField(max_length=255, default="", editable=False)
+    patronymic_search = models.CharField(max_length=255, default="", editable=False)
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_name", "id"], name="patient_last_name_idx"),
+            models.Index(fields=["last_name_search"], name="patient_last_name_search_idx",
+                         opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["first_name_search"], name="patient_first_name_search_idx",
+                         opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["patronymic_search"], name="patient_patronymic_search_idx",
+                         opclasses=["varchar_pattern_ops"]),
+        ]
+
+    def set_search_names(self):
+        for field in PATIENT_NAME_FIELDS:
+            setattr(self, f"{field}_search", normalize_name(getattr(self, field)))
+
+    def save(self, *args, **kwargs):
+        self.set_search_names()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = set(kwargs["update_fields"]) | \
+                {f"{field}_search" for field in PATIENT_NAME_FIELDS if field in kwargs["update_fields"]}
+        super().save(*args, **kwargs)
 
 
 class PatientTests(models.Model):
+    GRAPHIC_STATUSES = (
+        ("pending", "pending"),
+        ("processing", "processing"),
+        ("ready", "ready"),
+        ("failed", "failed"),
+    )
+
     analysis_date = models.DateField()
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
     doctor_id = models.ForeignKey(Doctor, on_delete=models.PROTECT)
     patient_id = models.ForeignKey(Patient, on_delete=models.PROTECT)
+    graphic_status = models.CharField(max_length=255, choices=GRAPHIC_STATUSES, default="ready")
+    graphic_claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient_id", "analysis_date"], name="patient_tests_date_idx"),
+        ]
 
 
 class Test(models.Model):
@@ -113,4 +182,81 @@ class CopyrightInfo(models.Model):
 
 class Graphic(models.Model):
     graphic = models.ImageField(upload_to="media")
+    input_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    test_name = models.CharField(max_length=255)
     patient_test_id = models.ForeignKey("PatientTests", on_delete=models.PROTECT)
+    test_id = models.ForeignKey("Test", on_delete=models.PROTECT, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient_test_id", "test_name"], name="unique_patient_test_graphic_name"),
+        ]
+
+
+class OrphanGraphicFile(models.Model):
+    graphic = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class TestRatio(models.Model):
+    test_name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    value = models.FloatField()
+    test_id = models.ForeignKey("Test", on_delete=models.PROTECT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["test_id", "name"], name="unique_test_ratio"),
+        ]
+        indexes = [
+            models.Index(fields=["test_name", "name", "value"], name="test_ratio_value_idx"),
+        ]
+
+
+class CohortRefs(models.Model):
+    diagnosis = models.CharField(max_length=255)
+    test_name = models.CharField(max_length=255)
+    min_refs = models.JSONField()
+    max_refs = models.JSONField()
+    needs_full_pass = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["diagnosis", "test_name"], name="unique_cohort_refs"),
+        ]
+
+
+class IndicatorAggregate(models.Model):
+    count = models.IntegerField()
+    mean = models.DecimalField(max_digits=9, decimal_places=4)
+    min = models.DecimalField(max_digits=5, decimal_places=2)
+    max = models.DecimalField(max_digits=5, decimal_places=2)
+    last_value = models.DecimalField(max_digits=5, decimal_places=2)
+    last_date = models.DateField()
+    patient_id = models.ForeignKey("Patient", on_delete=models.PROTECT)
+    indicator_id = models.ForeignKey("Indicator", on_delete=models.PROTECT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient_id", "indicator_id"], name="unique_indicator_aggregate"),
+        ]
+
+
+class RefsChangeJob(models.Model):
+    STATUSES = (
+        ("pending", "pending"),
+        ("processing", "processing"),
+        ("ready", "ready"),
+        ("failed", "failed"),
+    )
+
+    refs = models.JSONField()
+    resolved_refs = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=255, choices=STATUSES, default="pending")
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    last_test_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    test_id = models.ForeignKey("Test", on_delete=models.PROTECT)
+    doctor_id = models.ForeignKey(Doctor, on_delete=models.PROTECT)
@@ -0,0 +1,73 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class PatientCursorPagination(CursorPagination):
+    page_size = settings.PATIENTS_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.PATIENTS_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            last_name, patient_id, self.reverse = None, None, False
+            queryset = queryset.order_by("last_name", "id")
+        else:
+            last_name, patient_id, self.reverse = cursor
+            if self.reverse:
+                queryset = queryset.filter(Q(last_name__lt=last_name) | Q(last_name=last_name, id__lt=patient_id)) \
+                    .order_by("-last_name", "-id")
+            else:
+                queryset = queryset.filter(Q(last_name__gt=last_name) | Q(last_name=last_name, id__gt=patient_id)) \
+                    .order_by("last_name", "id")
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        has_next = self.reverse or has_more
+        has_previous = has_more if self.reverse else cursor is not None
+        if self.page:
+            self.next_position = (self.page[-1].last_name, self.page[-1].id) if has_next else None
+            self.previous_position = (self.page[0].last_name, self.page[0].id) if has_previous else None
+        else:
+            self.next_position = (last_name, patient_id - 1) if self.reverse else None
+            self.previous_position = (last_name, patient_id + 1) if cursor is not None and not self.reverse \
+                else None
+
+        return self.page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(*self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(*self.previous_position, True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            return str(cursor["last_name"]), int(cursor["id"]), bool(cursor["reverse"])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, last_name, patient_id, reverse):
+        cursor = json.dumps({"last_name": last_name, "id": patient_id, "reverse": reverse}, ensure_ascii=False)
+        encoded = urlsafe_b64encode(cursor.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import Doctor, SubjectInfo, CopyrightInfo, Patient, Test, Indicator, Graphic
+from oncology.services.analysis_service import PANEL_RATIOS
+from oncology.services.time_series_service import TIME_SERIES_BUCKETS
 
 
 class DoctorSignupSerializer(serializers.ModelSerializer):
@@ -47,6 +49,15 @@ class PatientSerializer(serializers.ModelSerializer):
 
 
 class PatientInfoSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        fields = request.query_params.get("fields") if request is not None else None
+        if fields:
+            selected = set(fields.split(","))
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
     class Meta:
         model = Patient
         fields = ("id", "first_name", "last_name", "patronymic", "birth_date",)
@@ -102,6 +113,64 @@ class ChangeRefsSerializer(serializers.Serializer):
     cd19_cd8_max = serializers.FloatField(required=False)
 
 
+class RatioOutliersSerializer(serializers.Serializer):
+    test_name = serializers.ChoiceField(choices=list(PANEL_RATIOS))
+    name = serializers.CharField()
+    min = serializers.FloatField(required=False)
+    max = serializers.FloatField(required=False)
+    patients = serializers.BooleanField(required=False, default=False)
+    limit = serializers.IntegerField(required=False, default=100, min_value=1, max_value=1000)
+
+    def validate(self, attrs):
+        if attrs["name"] not in [name for name, _, _ in PANEL_RATIOS[attrs["test_name"]]]:
+            raise serializers.ValidationError({"name": "Соотношение не относится к этому тесту"})
+        if "min" not in attrs and "max" not in attrs:
+            raise serializers.ValidationError("Нужно указать min и/или max")
+        return attrs
+
+
+class AnalysisComparisonSerializer(serializers.Serializer):
+    months = serializers.IntegerField(required=False, default=6, min_value=1, max_value=120)
+
+
+class TimeSeriesSerializer(serializers.Serializer):
+    indicators = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    ratios = serializers.ListField(child=serializers.ChoiceField(
+        choices=sorted({name for ratios in PANEL_RATIOS.values() for name, _, _ in ratios})),
+        required=False, default=list)
+    bucket = serializers.ChoiceField(choices=TIME_SERIES_BUCKETS, required=False, allow_null=True, default=None)
+    date_from = serializers.DateField(required=False, allow_null=True, default=None)
+    date_to = serializers.DateField(required=False, allow_null=True, default=None)
+
+    def validate(self, attrs):
+        if not attrs["indicators"] and not attrs["ratios"]:
+            raise serializers.ValidationError("Нужно указать indicators и/или ratios")
+        return attrs
+
+
+class CohortStatsSerializer(serializers.Serializer):
+    diagnosis = serializers.CharField(required=False, allow_blank=True, default="")
+    region = serializers.CharField(required=False, allow_blank=True, default="")
+    date_from = serializers.DateField(required=False, allow_null=True, default=None)
+    date_to = serializers.DateField(required=False, allow_null=True, default=None)
+
+    def validate(self, attrs):
+        if not attrs["diagnosis"] and not attrs["region"]:
+            raise serializers.ValidationError("Нужно указать diagnosis и/или region")
+        return attrs
+
+
+class TestsPatientSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False, allow_null=True, default=None)
+    date_to = serializers.DateField(required=False, allow_null=True, default=None)
+    limit = serializers.IntegerField(required=False, allow_null=True, default=None, min_value=1)
+
+
+class PatientAutocompleteSerializer(serializers.Serializer):
+    q = serializers.CharField(min_length=1, max_length=255)
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=50)
+
+
 class SearchPatientSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(required=False, allow_blank=True)
     last_name = serializers.CharField(required=False, allow_blank=True)
@@ -120,6 +189,9 @@ class SearchPatientSerializer(serializers.ModelSerializer):
 
 
 class GraphicSerializer(serializers.ModelSerializer):
+    conclusion = serializers.CharField(source="test_id.conclusion", read_only=True)
+    recommendations = serializers.CharField(source="test_id.recommendations", read_only=True)
+
     class Meta:
         model = Graphic
-        fields = ("graphic",)
+        fields = ("graphic", "test_name", "test_id", "conclusion", "recommendations",)
@@ -0,0 +1,60 @@
+from django.db.models import Avg, Count, Exists, Max, Min, OuterRef, Subquery
+from oncology.models import Analysis, IndicatorAggregate, Patient
+
+
+AGGREGATES_REBUILD_CHUNK_SIZE = 500
+
+
+def get_aggregated_analysises():
+    return Analysis.objects.exclude(test_id__name="regeneration_type")
+
+
+def update_indicator_aggregates(patient_ids, indicator_ids=None):
+    analysises = get_aggregated_analysises().filter(test_id__patient_test_id__patient_id__in=patient_ids)
+    aggregates = IndicatorAggregate.objects.filter(patient_id__in=patient_ids)
+    if indicator_ids is not None:
+        analysises = analysises.filter(indicator_id__in=indicator_ids)
+        aggregates = aggregates.filter(indicator_id__in=indicator_ids)
+
+    last_analysises = get_aggregated_analysises().filter(
+        test_id__patient_test_id__patient_id=OuterRef("test_id__patient_test_id__patient_id"),
+        indicator_id=OuterRef("indicator_id"),
+    ).order_by("-test_id__patient_test_id__analysis_date", "-id")
+    rows = analysises.values("test_id__patient_test_id__patient_id", "indicator_id").annotate(
+        count=Count("id"),
+        mean=Avg("value"),
+        min=Min("value"),
+        max=Max("value"),
+        last_date=Max("test_id__patient_test_id__analysis_date"),
+        last_value=Subquery(last_analysises.values("value")[:1]),
+    ).order_by()
+
+    IndicatorAggregate.objects.bulk_create(
+        [IndicatorAggregate(patient_id_id=row["test_id__patient_test_id__patient_id"],
+                            indicator_id_id=row["indicator_id"], count=row["count"], mean=row["mean"],
+                            min=row["min"], max=row["max"], last_value=row["last_value"],
+                            last_date=row["last_date"]) for row in rows],
+        update_conflicts=True, unique_fields=["patient_id", "indicator_id"],
+        update_fields=["count", "mean", "min", "max", "last_value", "last_date"])
+
+    aggregates.exclude(Exists(get_aggregated_analysises().filter(
+        test_id__patient_test_id__patient_id=OuterRef("patient_id"), indicator_id=OuterRef("indicator_id")))
+    ).delete()
+
+
+def rebuild_indicator_aggregates():
+    IndicatorAggregate.objects.all().delete()
+    last_patient_id = 0
+    while True:
+        patient_ids = list(Patient.objects.filter(id__gt=last_patient_id).order_by("id")
+                           .values_list("id", flat=True)[:AGGREGATES_REBUILD_CHUNK_SIZE])
+        if not patient_ids:
+            return
+        update_indicator_aggregates(patient_ids)
+        last_patient_id = patient_ids[-1]
+
+
+def get_indicator_aggregates(patient_id):
+    return {aggregate["indicator_id__name"]: aggregate
+            for aggregate in IndicatorAggregate.objects.filter(patient_id=patient_id).values(
+                "indicator_id__name", "count", "mean", "min", "max", "last_value", "last_date")}
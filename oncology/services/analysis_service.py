@@ -1,127 +1,119 @@
-from django.db.models import Avg
-from oncology.models import Analysis, Test
-from oncology.services.patient_test_service import get_patient_tests_by_patient_id_and_analysis_date
-
-
-def get_regeneration_analysis(regeneration_type_tests, regeneration_indicators):
-    lymf = Analysis.objects.get(test_id=regeneration_type_tests,
-                                indicator_id=regeneration_indicators["lymf_indicator"]).value
-    mon = Analysis.objects.get(test_id=regeneration_type_tests,
-                               indicator_id=regeneration_indicators["mon_indicator"]).value
-    neu = Analysis.objects.get(test_id=regeneration_type_tests,
-                               indicator_id=regeneration_indicators["neu_indicator"]).value
-
-    regeneration_analysis = [lymf / mon, neu / lymf, neu / mon]
-
-    return regeneration_analysis
-
-
-def get_hematological_and_immune_analysis(hematological_research_tests, immune_status_tests,
-                                          hematological_and_immune_indicators):
-    lymf = Analysis.objects.get(test_id=hematological_research_tests,
-                                indicator_id=hematological_and_immune_indicators["lymf_indicator"]).value
-    neu = Analysis.objects.get(test_id=hematological_research_tests,
-                               indicator_id=hematological_and_immune_indicators["neu_indicator"]).value
-    cd19 = Analysis.objects.get(test_id=immune_status_tests,
-                                indicator_id=hematological_and_immune_indicators["cd19_indicator"]).value
-    cd4 = Analysis.objects.get(test_id=immune_status_tests,
-                               indicator_id=hematological_and_immune_indicators["cd4_indicator"]).value
-    cd8 = Analysis.objects.get(test_id=immune_status_tests,
-                               indicator_id=hematological_and_immune_indicators["cd8_indicator"]).value
-    cd3 = Analysis.objects.get(test_id=immune_status_tests,
-                               indicator_id=hematological_and_immune_indicators["cd3_indicator"]).value
-
-    hematological_analysis = [cd19 / cd4, lymf / cd19, neu / lymf, cd19 / cd8]
-    immune_analysis = [neu / cd4, neu / cd3, neu / lymf, neu / cd8]
-
+from dateutil.relativedelta import relativedelta
+from django.db.models import Avg, Max, Min, Q
+from oncology.models import Analysis
+from .aggregate_service import get_indicator_aggregates
+from .indicator_service import get_indicator_label
+
+
+PANEL_RATIOS = {
+    "regeneration_type": [
+        ("lymf_mon", ("regeneration_type", "lymphocytes"), ("regeneration_type", "monocytes")),
+        ("neu_lymf", ("regeneration_type", "neutrophils"), ("regeneration_type", "lymphocytes")),
+        ("neu_mon", ("regeneration_type", "neutrophils"), ("regeneration_type", "monocytes")),
+    ],
+    "hematological_research": [
+        ("cd19_cd4", ("immune_status", "b_lymphocytes"), ("immune_status", "t_helpers")),
+        ("lymf_cd19", ("hematological_research", "lymphocytes"), ("immune_status", "b_lymphocytes")),
+        ("neu_lymf", ("hematological_research", "neutrophils"), ("hematological_research", "lymphocytes")),
+        ("cd19_cd8", ("immune_status", "b_lymphocytes"), ("immune_status", "t_cytotoxic_lymphocytes")),
+    ],
+    "immune_status": [
+        ("neu_cd4", ("hematological_research", "neutrophils"), ("immune_status", "t_helpers")),
+        ("neu_cd3", ("hematological_research", "neutrophils"), ("immune_status", "t_lymphocytes")),
+        ("neu_lymf", ("hematological_research", "neutrophils"), ("hematological_research", "lymphocytes")),
+        ("neu_cd8", ("hematological_research", "neutrophils"), ("immune_status", "t_cytotoxic_lymphocytes")),
+    ],
+    "cytokine_status": [
+        ("cd3_il2", ("cytokine_status", "cd3_il2_stimulated"), ("cytokine_status", "cd3_il2_spontaneous")),
+        ("cd3_tnfa", ("cytokine_status", "cd3_tnfa_stimulated"), ("cytokine_status", "cd3_tnfa_spontaneous")),
+        ("cd3_ifny", ("cytokine_status", "cd3_ifny_stimulated"), ("cytokine_status", "cd3_ifny_spontaneous")),
+    ],
+}
+
+
+def get_analysis_values(patient_test):
+    analysis_values = {}
+    analysises = Analysis.objects.filter(test_id__patient_test_id=patient_test) \
+        .values_list("test_id__name", "indicator_id__name", "value")
+    for test_name, indicator_name, value in analysises:
+        analysis_values.setdefault(test_name, {})[indicator_name] = value
+
+    return analysis_values
+
+
+def get_panel_ratios(analysis_values, panel_name):
+    return [analysis_values[numerator_test][numerator] / analysis_values[denominator_test][denominator]
+            for _, (numerator_test, numerator), (denominator_test, denominator) in PANEL_RATIOS[panel_name]]
+
+
+def get_regeneration_analysis(analysis_values):
+    return get_panel_ratios(analysis_values, "regeneration_type")
+
+
+def get_hematological_and_immune_analysis(analysis_values):
     hematological_and_immune_analysis = {
-        "hematological_analysis": hematological_analysis,
-        "immune_analysis": immune_analysis,
+        "hematological_analysis": get_panel_ratios(analysis_values, "hematological_research"),
+        "immune_analysis": get_panel_ratios(analysis_values, "immune_status"),
     }
 
     return hematological_and_immune_analysis
 
 
-def get_cytokine_analysis(cytokine_status_tests, cytokine_indicators):
-    cd3_il2_stimulated = Analysis.objects.get(test_id=cytokine_status_tests,
-                                              indicator_id=cytokine_indicators["cd3_il2_stimulated_indicator"]).value
-    cd3_il2_spontaneous = Analysis.objects.get(test_id=cytokine_status_tests,
-                                               indicator_id=cytokine_indicators["cd3_il2_spontaneous_indicator"]).value
-    cd3_tnfa_stimulated = Analysis.objects.get(test_id=cytokine_status_tests,
-                                               indicator_id=cytokine_indicators["cd3_tnfa_stimulated_indicator"]).value
-    cd3_tnfa_spontaneous = Analysis.objects.get(test_id=cytokine_status_tests,
-                                                indicator_id=cytokine_indicators[
-                                                    "cd3_tnfa_spontaneous_indicator"]).value
-    cd3_ifny_stimulated = Analysis.objects.get(test_id=cytokine_status_tests,
-                                               indicator_id=cytokine_indicators["cd3_ifny_stimulated_indicator"]).value
-    cd3_ifny_spontaneous = Analysis.objects.get(test_id=cytokine_status_tests,
-                                                indicator_id=cytokine_indicators[
-                                                    "cd3_ifny_spontaneous_indicator"]).value
-
-    cytokine_analysis = [
-        cd3_il2_stimulated / cd3_il2_spontaneous,
-        cd3_tnfa_stimulated / cd3_tnfa_spontaneous,
-        cd3_ifny_stimulated / cd3_ifny_spontaneous
-    ]
-
-    return cytokine_analysis
+def get_cytokine_analysis(analysis_values):
+    return get_panel_ratios(analysis_values, "cytokine_status")
 
 
 def get_analysises_by_test_id(test_id):
-    return Analysis.objects.filter(test_id=test_id)
-
-
-def get_analysises_and_analysis_prev_by_test_id(instance, patient_test_date):
-    season = str(patient_test_date).split("-")[1]
-    if season in ["02", "03", "04", "05", "06", "07"]:
-        patient_tests_prev = get_patient_tests_by_patient_id_and_analysis_date(instance, [2, 3, 4, 5, 6, 7])
-    else:
-        patient_tests_prev = get_patient_tests_by_patient_id_and_analysis_date(instance, [8, 9, 10, 11, 12, 1])
-
-    tests_prev = Test.objects.filter(patient_test_id__in=patient_tests_prev).exclude(name="regeneration_type") \
-        .values("id")
-
-    analysises_prev = Analysis.objects.filter(test_id__in=tests_prev)
-
-    tests = Test.objects.filter(patient_test_id=instance.patient_test_id).values("id").exclude(name="regeneration_type")
-    analysises = Analysis.objects.filter(test_id__in=tests).values("id", "indicator_id__name",
-                                                                   "value", "indicator_id__unit",
-                                                                   "indicator_id__interval_min",
-                                                                   "indicator_id__interval_max")
-    return analysises_prev, analysises
-
-
-def get_analysis_comparison(data, analysises_prev, analysises, names_dict):
-    if analysises_prev:
-        for analysis in analysises:
-            name = analysis["indicator_id__name"]
-            avg = analysises_prev.filter(indicator_id__name=name).aggregate(Avg("value"))[
-                "value__avg"]
-            changes = (analysis["value"] - avg) / avg * 100
-            res = {
-                "name": names_dict[name],
-                "value": analysis["value"],
-                "avg_prev_value": round(avg, 2),
-                "interval_min": analysis["indicator_id__interval_min"],
-                "interval_max": analysis["indicator_id__interval_max"],
-                "unit": analysis["indicator_id__unit"],
-                "changes": round(changes, 2)
-            }
-            data["analysis"].append(res)
-    else:
-        for analysis in analysises:
-            name = analysis["indicator_id__name"]
-            avg = None
-            changes = None
-            res = {
-                "name": names_dict[name],
-                "value": analysis["value"],
-                "avg_prev_value": avg,
-                "interval_min": analysis["indicator_id__interval_min"],
-                "interval_max": analysis["indicator_id__interval_max"],
-                "unit": analysis["indicator_id__unit"],
-                "changes": changes
-            }
-            data["analysis"].append(res)
+    return Analysis.objects.filter(test_id=test_id).values(
+        "value", "indicator_id__name", "indicator_id__interval_min", "indicator_id__interval_max", "indicator_id__unit"
+    ).order_by("id")
+
+
+def get_analysis_comparison(instance, months):
+    patient_test = instance.patient_test_id
+    date_from = patient_test.analysis_date - relativedelta(months=months)
+    is_current = Q(test_id__patient_test_id=patient_test.id)
+    is_prev = Q(test_id__patient_test_id__analysis_date__lt=patient_test.analysis_date)
+
+    analysises = Analysis.objects.filter(
+        is_current | is_prev,
+        test_id__patient_test_id__patient_id=patient_test.patient_id_id,
+        test_id__patient_test_id__analysis_date__gte=date_from,
+        test_id__patient_test_id__analysis_date__lte=patient_test.analysis_date,
+    ).exclude(test_id__name="regeneration_type").values(
+        "indicator_id__name", "indicator_id__unit", "indicator_id__interval_min", "indicator_id__interval_max"
+    ).annotate(
+        first_id=Min("id", filter=is_current),
+        current_value=Max("value", filter=is_current),
+        avg_prev_value=Avg("value", filter=is_prev),
+    ).filter(first_id__isnull=False).order_by("first_id")
+
+    aggregates = get_indicator_aggregates(patient_test.patient_id_id)
+
+    data = {"analysis": []}
+    for analysis in analysises:
+        aggregate = aggregates.get(analysis["indicator_id__name"])
+        avg = analysis["avg_prev_value"]
+        changes = None
+        if avg:
+            changes = round((analysis["current_value"] - avg) / avg * 100, 2)
+            avg = round(avg, 2)
+        data["analysis"].append({
+            "name": get_indicator_label(analysis["indicator_id__name"]),
+            "value": analysis["current_value"],
+            "avg_prev_value": avg,
+            "interval_min": analysis["indicator_id__interval_min"],
+            "interval_max": analysis["indicator_id__interval_max"],
+            "unit": analysis["indicator_id__unit"],
+            "changes": changes,
+            "history": aggregate and {
+                "count": aggregate["count"],
+                "avg_value": round(aggregate["mean"], 2),
+                "min_value": aggregate["min"],
+                "max_value": aggregate["max"],
+                "last_value": aggregate["last_value"],
+                "last_date": aggregate["last_date"],
+            },
+        })
 
     return data
@@ -0,0 +1,175 @@
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Min, Q, Value, Window
+from django.db.models.functions import RowNumber
+from oncology.models import Analysis, TestRatio, CohortRefs
+from .analysis_service import PANEL_RATIOS
+from .indicator_service import get_indicators_registry, get_default_refs
+from .ratio_service import get_ratio_names
+
+
+COHORT_STATS_VERSION_KEY = "cohort_stats_version"
+COHORT_STATS_PERCENTILES = (5, 25, 50, 75, 95)
+COHORT_DIAGNOSIS_FIELD = "test_id__patient_test_id__patient_id__diagnosis"
+
+
+def reset_cohort_stats():
+    cache.set(COHORT_STATS_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_cohort_stats_version():
+    version = cache.get(COHORT_STATS_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(COHORT_STATS_VERSION_KEY, version, None)
+        version = cache.get(COHORT_STATS_VERSION_KEY, version)
+    return version
+
+
+def filter_cohort(queryset, diagnosis, region, date_from, date_to):
+    if diagnosis:
+        queryset = queryset.filter(test_id__patient_test_id__patient_id__diagnosis=diagnosis)
+    if region:
+        queryset = queryset.filter(test_id__patient_test_id__patient_id__region=region)
+    if date_from:
+        queryset = queryset.filter(test_id__patient_test_id__analysis_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(test_id__patient_test_id__analysis_date__lte=date_to)
+    return queryset
+
+
+def get_group_aggregates(queryset, group_fields, outside_refs):
+    outside_count = Count("id", filter=outside_refs) if outside_refs else Value(0)
+    return queryset.values(*group_fields) \
+        .annotate(count=Count("id"), mean=Avg("value"), min_value=Min("value"), max_value=Max("value"),
+                  outside_count=outside_count) \
+        .order_by(*group_fields)
+
+
+def get_percentile_positions(count, percentile):
+    lower = (count - 1) * percentile // 100
+    upper = ((count - 1) * percentile + 99) // 100
+    return lower, upper
+
+
+def get_percentile_values(queryset, group_fields):
+    partition_by = [F(field) for field in group_fields]
+    queryset = queryset.annotate(
+        position=Window(RowNumber(), partition_by=partition_by, order_by=[F("value").asc(), F("id").asc()]),
+        group_size=Window(Count("id"), partition_by=partition_by),
+    )
+    positions = Q()
+    for percentile in COHORT_STATS_PERCENTILES:
+        positions |= Q(position=(F("group_size") - 1) * percentile / 100 + 1)
+        positions |= Q(position=((F("group_size") - 1) * percentile + 99) / 100 + 1)
+
+    values = {}
+    for *group, position, value in queryset.filter(positions).values_list(*group_fields, "position", "value"):
+        values.setdefault(tuple(group), {})[position - 1] = float(value)
+    return values
+
+
+def get_distribution(aggregates, values, has_refs):
+    count = aggregates["count"]
+    percentiles = {}
+    for percentile in COHORT_STATS_PERCENTILES:
+        lower, upper = get_percentile_positions(count, percentile)
+        position = (count - 1) * percentile / 100
+        value = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        percentiles[f"p{percentile}"] = round(value, 4)
+    return {
+        "count": count,
+        "mean": round(float(aggregates["mean"]), 4),
+        "min_value": round(float(aggregates["min_value"]), 4),
+        "max_value": round(float(aggregates["max_value"]), 4),
+        "percentiles": percentiles,
+        "outside_refs_share": round(aggregates["outside_count"] / count, 4) if has_refs else None,
+    }
+
+
+def get_indicators_stats(diagnosis, region, date_from, date_to):
+    queryset = filter_cohort(Analysis.objects.exclude(test_id__name="regeneration_type"),
+                             diagnosis, region, date_from, date_to)
+    outside_refs = Q(value__lt=F("indicator_id__interval_min")) | Q(value__gt=F("indicator_id__interval_max"))
+    aggregates = list(get_group_aggregates(queryset, ["indicator_id__name"], outside_refs))
+    if not aggregates:
+        return []
+    values = get_percentile_values(queryset, ["indicator_id__name"])
+
+    indicators = get_indicators_registry()["indicators"]
+    stats = []
+    for row in aggregates:
+        name = row["indicator_id__name"]
+        indicator = indicators.get(name)
+        has_refs = indicator is not None and \
+            (indicator.interval_min is not None or indicator.interval_max is not None)
+        stats.append({"name": name, **get_distribution(row, values[(name,)], has_refs)})
+    return stats
+
+
+def get_ratio_refs(diagnoses):
+    ratio_refs = {}
+    for test_name in PANEL_RATIOS:
+        min_refs, max_refs = get_default_refs(test_name)
+        for diagnosis in diagnoses:
+            ratio_refs[diagnosis, test_name] = min_refs, max_refs
+    for refs in CohortRefs.objects.filter(diagnosis__in=diagnoses):
+        ratio_refs[refs.diagnosis, refs.test_name] = refs.min_refs, refs.max_refs
+    return ratio_refs
+
+
+def get_ratios_outside_refs(diagnoses):
+    diagnoses_by_refs = {}
+    for (diagnosis, test_name), (min_refs, max_refs) in get_ratio_refs(diagnoses).items():
+        for name, min_ref, max_ref in zip(get_ratio_names(test_name), min_refs, max_refs):
+            if min_ref is not None or max_ref is not None:
+                diagnoses_by_refs.setdefault((test_name, name, min_ref, max_ref), []).append(diagnosis)
+
+    outside_refs = Q()
+    ratios_with_refs = set()
+    for (test_name, name, min_ref, max_ref), refs_diagnoses in diagnoses_by_refs.items():
+        bounds = Q()
+        if min_ref is not None:
+            bounds |= Q(value__lt=min_ref)
+        if max_ref is not None:
+            bounds |= Q(value__gt=max_ref)
+        outside_refs |= Q(bounds, test_name=test_name, name=name,
+                          **{f"{COHORT_DIAGNOSIS_FIELD}__in": refs_diagnoses})
+        ratios_with_refs.add((test_name, name))
+    return outside_refs, ratios_with_refs
+
+
+def get_ratios_stats(diagnosis, region, date_from, date_to):
+    queryset = filter_cohort(TestRatio.objects.all(), diagnosis, region, date_from, date_to)
+    diagnoses = [diagnosis] if diagnosis else \
+        list(queryset.order_by().values_list(COHORT_DIAGNOSIS_FIELD, flat=True).distinct())
+    if not diagnoses:
+        return []
+    outside_refs, ratios_with_refs = get_ratios_outside_refs(diagnoses)
+    aggregates = list(get_group_aggregates(queryset, ["test_name", "name"], outside_refs))
+    if not aggregates:
+        return []
+    values = get_percentile_values(queryset, ["test_name", "name"])
+
+    stats = []
+    for row in aggregates:
+        key = row["test_name"], row["name"]
+        stats.append({"test_name": row["test_name"], "name": row["name"],
+                      **get_distribution(row, values[key], key in ratios_with_refs)})
+    return stats
+
+
+def get_cohort_stats(diagnosis=None, region=None, date_from=None, date_to=None):
+    params = f"{diagnosis}\n{region}\n{date_from}\n{date_to}"
+    cache_key = "cohort_stats:{}:{}".format(get_cohort_stats_version(),
+                                           hashlib.sha256(params.encode()).hexdigest())
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = {
+            "indicators": get_indicators_stats(diagnosis, region, date_from, date_to),
+            "ratios": get_ratios_stats(diagnosis, region, date_from, date_to),
+        }
+        cache.set(cache_key, stats, settings.COHORT_STATS_CACHE_TIMEOUT)
+    return stats
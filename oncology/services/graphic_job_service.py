@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from oncology.models import PatientTests
+from .graphic_service import save_graphics, get_charts
+
+
+logger = logging.getLogger(__name__)
+
+executor = None
+executor_lock = threading.Lock()
+patient_tests_in_progress = set()
+patient_tests_requeued = set()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is not None:
+            return executor
+        executor = ThreadPoolExecutor(max_workers=settings.GRAPHIC_WORKERS, thread_name_prefix="graphic-worker")
+    if settings.GRAPHIC_RENDERING == "eager":
+        executor.submit(resubmit_graphics)
+    return executor
+
+
+def start_graphic_workers():
+    if executor is None and settings.GRAPHIC_WORKERS and settings.GRAPHIC_RENDERING == "eager":
+        get_executor()
+
+
+def resubmit_graphics():
+    try:
+        for patient_test_id in PatientTests.objects.filter(get_claimable_filter()).order_by("id") \
+                .values_list("id", flat=True):
+            submit_graphics(patient_test_id)
+    finally:
+        close_old_connections()
+
+
+def draw_graphics(patient_test):
+    save_graphics(patient_test, get_charts(patient_test))
+
+
+def get_claimable_filter(statuses=("pending",)):
+    stale_at = timezone.now() - timedelta(seconds=settings.GRAPHIC_CLAIM_TIMEOUT)
+    return Q(graphic_status__in=statuses) | Q(graphic_status="processing", graphic_claimed_at__lt=stale_at) \
+        | Q(graphic_status="processing", graphic_claimed_at__isnull=True)
+
+
+def is_claimable(patient_test):
+    if patient_test.graphic_status == "pending":
+        return True
+    stale_at = timezone.now() - timedelta(seconds=settings.GRAPHIC_CLAIM_TIMEOUT)
+    return patient_test.graphic_status == "processing" and \
+        (patient_test.graphic_claimed_at is None or patient_test.graphic_claimed_at < stale_at)
+
+
+def claim_patient_tests(patient_test_id, statuses=("pending",)):
+    return PatientTests.objects.filter(get_claimable_filter(statuses), id=patient_test_id) \
+        .update(graphic_status="processing", graphic_claimed_at=timezone.now()) == 1
+
+
+def draw_claimed_graphics(patient_test_id):
+    try:
+        draw_graphics(PatientTests.objects.get(id=patient_test_id))
+    except Exception:
+        logger.exception("Не удалось построить графики для PatientTests %s", patient_test_id)
+        PatientTests.objects.filter(id=patient_test_id, graphic_status="processing").update(graphic_status="failed")
+        return False
+    PatientTests.objects.filter(id=patient_test_id, graphic_status="processing").update(graphic_status="ready")
+    return True
+
+
+def process_patient_tests_graphics(patient_test_id, statuses=("pending",)):
+    while claim_patient_tests(patient_test_id, statuses):
+        statuses = ("pending",)
+        if not draw_claimed_graphics(patient_test_id):
+            return
+
+
+def run_in_executor(patient_test_id):
+    requeued = True
+    try:
+        while requeued:
+            while claim_patient_tests(patient_test_id) and draw_claimed_graphics(patient_test_id):
+                pass
+            with executor_lock:
+                requeued = patient_test_id in patient_tests_requeued
+                patient_tests_requeued.discard(patient_test_id)
+                if not requeued:
+                    patient_tests_in_progress.discard(patient_test_id)
+    except Exception:
+        with executor_lock:
+            patient_tests_requeued.discard(patient_test_id)
+            patient_tests_in_progress.discard(patient_test_id)
+        raise
+    finally:
+        close_old_connections()
+
+
+def submit_graphics(patient_test_id):
+    if not settings.GRAPHIC_WORKERS:
+        return
+    with executor_lock:
+        if patient_test_id in patient_tests_in_progress:
+            patient_tests_requeued.add(patient_test_id)
+            return
+        patient_tests_in_progress.add(patient_test_id)
+    get_executor().submit(run_in_executor, patient_test_id)
+
+
+def enqueue_graphics(patient_test):
+    if settings.GRAPHIC_RENDERING == "off":
+        return
+    PatientTests.objects.filter(id=patient_test.id).update(graphic_status="pending")
+    if settings.GRAPHIC_RENDERING == "eager":
+        transaction.on_commit(lambda: submit_graphics(patient_test.id))
+
+
+def render_graphics_on_demand(patient_test_id):
+    if claim_patient_tests(patient_test_id):
+        draw_claimed_graphics(patient_test_id)
+
+    deadline = time.monotonic() + settings.GRAPHIC_RENDER_TIMEOUT
+    while True:
+        graphic_status = PatientTests.objects.values_list("graphic_status", flat=True).get(id=patient_test_id)
+        if graphic_status not in ("pending", "processing") or time.monotonic() >= deadline:
+            return graphic_status
+        time.sleep(0.1)
@@ -1,85 +1,236 @@
+import hashlib
+import json
+import math
+import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from oncology.models import Graphic
-from .indicator_service import get_hematological_indicators, get_immune_indicators, get_hematological_refs,\
-    get_immune_refs
+from collections import OrderedDict
+from oncology.models import Graphic, Test, OrphanGraphicFile, PatientTests
+from .indicator_service import get_default_refs
+from .ratio_service import get_patient_test_ratios
 from decimal import Decimal
 from io import BytesIO
 from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from botocore.config import Config
+from datetime import timedelta
 from django.conf import settings
-from django.db.models import Q
-
-
-def get_indicator_values(first, second, val):
-    if val is None:
-        min = first.interval_min / second.interval_min
-        max = first.interval_max / second.interval_max
-    else:
-        min = first.interval_min / second.interval_min / Decimal(val)
-        max = first.interval_max / second.interval_max / Decimal(val)
-    if max > min:
-        return min, max
-    return max, min
-
-
-def get_refs(refs):
-    min_refs = []
-    max_refs = []
-    for ref in refs:
-        min, max = get_indicator_values(ref[0], ref[1], ref[2])
-        min_refs.append(min)
-        max_refs.append(max)
-    return min_refs, max_refs
+from django.db import transaction
+from django.utils import timezone
+
+
+CHART_PANELS = {
+    "hematological_research": {
+        "labels": ["CD19/CD4", "LYMF/CD19", "NEU/LYMF", "CD19/CD8"],
+        "scale": [0.2, 2, 0.4, 0.2],
+        "rotation": 0,
+        "yticks": None,
+        "marks": [[0.04, 1.2, "0.2"], [0.02, 2.2, "0.4"], [0.015, 3.2, "0.6"], [0.01, 4.2, "0.8"],
+                  [-1.33, 0.95, "0.2"], [-1.46, 1.95, "0.4"], [-1.50, 2.95, "0.6"], [-1.515, 3.95, "0.8"],
+                  [-3.2, 0.8, "0.4"], [-3.17, 1.8, "0.8"], [-3.16, 2.8, "1.2"], [-3.155, 3.8, "1.6"],
+                  [1.375, 1.05, "2.0"], [1.46, 2.05, "4.0"], [1.5, 3.05, "6.0"], [1.52, 4.05, "8.0"]],
+    },
+    "immune_status": {
+        "labels": ["NEU/CD4", "NEU/CD3", "NEU/LYMF", "NEU/CD8"],
+        "scale": [1.0, 0.8, 0.4, 2.6],
+        "rotation": 0,
+        "yticks": None,
+        "marks": [[0.04, 1.2, "1.0"], [0.02, 2.2, "2.0"], [0.015, 3.2, "3.0"], [0.01, 4.2, "4.0"],
+                  [-1.33, 0.95, "2.6"], [-1.46, 1.95, "5.2"], [-1.50, 2.95, "7.8"], [-1.515, 3.95, "10.4"],
+                  [-3.2, 0.8, "0.4"], [-3.17, 1.8, "0.8"], [-3.16, 2.8, "1.2"], [-3.155, 3.8, "1.6"],
+                  [1.375, 1.05, "0.8"], [1.46, 2.05, "1.6"], [1.5, 3.05, "2.4"], [1.52, 4.05, "3.2"]],
+    },
+    "cytokine_status": {
+        "labels": ["Интерликин", "ФНО", "Интерферон"],
+        "scale": [24.0, 24.0, 24.0],
+        "rotation": np.pi / 6,
+        "yticks": None,
+        "marks": [[-0.47, 1.3, "24.0"], [-0.478, 2.3, "48.0"], [-0.489, 3.3, "72.0"], [-0.502, 4.3, "96.0"],
+                  [-2.3, 0.95, "24.0"], [-2.465, 1.95, "48.0"], [-2.51, 2.95, "72.0"], [-2.54, 3.95, "96.0"],
+                  [1.3, 1.05, "24.0"], [1.428, 2.05, "48.0"], [1.467, 3.05, "72.0"], [1.488, 4.05, "96.0"]],
+    },
+    "regeneration_type": {
+        "labels": ["Лимфоциты/моноциты", "Нейтрофилы/лимфоциты", "Нейтрофилы/моноциты"],
+        "scale": [2, 0.58, 3],
+        "rotation": np.pi / 6,
+        "yticks": [1, 2, 3, 4, 5],
+        "marks": [[-0.47, 1.3, "1.85"], [-0.478, 2.3, "3.7"], [-0.489, 3.3, "5.55"], [-0.502, 4.3, "7.4"],
+                  [1.3, 1.05, "0.58"], [1.428, 2.05, "1.16"], [1.467, 3.05, "1.74"], [1.488, 4.05, "2.32"],
+                  [-2.3, 0.95, "3.0"], [-2.465, 1.95, "6.0"], [-2.51, 2.95, "9.0"], [-2.54, 3.95, "12.0"]],
+    },
+}
+
+CHART_VERSION = 1
+CHART_LEGEND_LABELS = ("Результаты", "Нижние референтные значения", "Верхние референтные значения")
+CHART_MIN_RADIAL_LIMIT = 5
+CHART_TEMPLATES_MAX_SIZE = 32
+
+S3_DELETE_BATCH_SIZE = 1000
+
+chart_templates = OrderedDict()
+chart_templates_lock = threading.Lock()
+
+s3_client = None
+upload_executor = None
+s3_lock = threading.Lock()
 
 
 def draw_values(angles, values, values_not_scaled, ax):
+    annotations = []
     for i, angle in enumerate(angles):
         y = values[i]
 
         x_arrow = angle
         y_arrow = y
 
-        ax.annotate(str(values_not_scaled[i])[0:4], fontsize=8, xy=(x_arrow, y_arrow),
-                    xytext=(Decimal(x_arrow) + Decimal(0.35), Decimal(y_arrow) + Decimal(0.15)),
-                    arrowprops=dict(arrowstyle="->", color="black"))
+        annotations.append(ax.annotate(str(values_not_scaled[i])[0:4], fontsize=8, xy=(x_arrow, y_arrow),
+                                       xytext=(Decimal(x_arrow) + Decimal(0.35), Decimal(y_arrow) + Decimal(0.15)),
+                                       arrowprops=dict(arrowstyle="->", color="black")))
+    return annotations
 
 
-def get_s3_and_bucket_name():
-    s3 = boto3.client("s3", aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                      aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                      endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-                      region_name=settings.AWS_S3_REGION_NAME)
-    bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+def get_s3_client():
+    global s3_client
+    with s3_lock:
+        if s3_client is None:
+            s3_client = boto3.session.Session().client(
+                "s3", aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                region_name=settings.AWS_S3_REGION_NAME,
+                config=Config(max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                              retries={"max_attempts": 3, "mode": "standard"}))
+    return s3_client
 
-    return s3, bucket_name
 
+def reset_s3_client():
+    global s3_client
+    with s3_lock:
+        s3_client = None
 
-def save_graphic(fig, graphic_name, patient_test, latest_graphic_id=None):
-    if latest_graphic_id is None:
-        latest_graphic_id = 1
-        if Graphic.objects.exists():
-            latest_graphic_id = Graphic.objects.latest("pk").pk + 1
 
-    file_path = f"{graphic_name}_{latest_graphic_id}.png"
-    canvas = FigureCanvasAgg(fig)
-    buffer = BytesIO()
-    canvas.print_png(buffer)
-    buffer.seek(0)
+def get_upload_executor():
+    global upload_executor
+    with s3_lock:
+        if upload_executor is None:
+            upload_executor = ThreadPoolExecutor(max_workers=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                                                 thread_name_prefix="graphic-upload")
+    return upload_executor
 
-    s3, bucket_name = get_s3_and_bucket_name()
-    s3.upload_fileobj(buffer, bucket_name, file_path)
-    graphic_instance = Graphic.objects.create(id=latest_graphic_id, graphic=file_path, patient_test_id=patient_test)
 
-    return graphic_instance.id
+def get_s3_and_bucket_name():
+    return get_s3_client(), settings.AWS_STORAGE_BUCKET_NAME
 
 
-def delete_graphic(graphics_to_delete):
+def upload_graphic_files(files):
+    if not files:
+        return
     s3, bucket_name = get_s3_and_bucket_name()
-    for graphic in graphics_to_delete:
-        s3.delete_object(Bucket=bucket_name, Key=graphic.graphic.name)
 
-    graphics_to_delete.delete()
+    def upload(buffer, file_path):
+        s3.put_object(Bucket=bucket_name, Key=file_path, Body=buffer.getvalue(), ContentType="image/png")
+
+    if len(files) == 1:
+        upload(*files[0])
+        return
+    futures = [get_upload_executor().submit(upload, buffer, file_path) for buffer, file_path in files]
+    for future in futures:
+        future.result()
+
+
+def get_chart_hash(graphic_name, values, min_refs, max_refs):
+    chart_inputs = json.dumps([CHART_VERSION, graphic_name, [str(value) for value in values],
+                               [str(ref) for ref in min_refs], [str(ref) for ref in max_refs]])
+    return hashlib.sha256(chart_inputs.encode()).hexdigest()
+
+
+def save_graphics(patient_test, charts):
+    charts_inputs = {}
+    for graphic_name, values in charts.items():
+        min_refs, max_refs = get_default_refs(graphic_name)
+        input_hash = get_chart_hash(graphic_name, values, min_refs, max_refs)
+        charts_inputs[graphic_name] = (input_hash, values, min_refs, max_refs)
+
+    with transaction.atomic():
+        OrphanGraphicFile.objects.filter(graphic__in=[f"{graphic_name}_{inputs[0]}.png"
+                                                      for graphic_name, inputs in charts_inputs.items()]).delete()
+        PatientTests.objects.select_for_update().values_list("id", flat=True).get(id=patient_test.id)
+
+        existing_graphics = {graphic.test_name: graphic
+                             for graphic in Graphic.objects.filter(patient_test_id=patient_test)}
+        test_ids = dict(Test.objects.filter(patient_test_id=patient_test, name__in=charts).order_by("id")
+                        .values_list("name", "id"))
+        stored_hashes = set(Graphic.objects.filter(input_hash__in=[inputs[0] for inputs in charts_inputs.values()])
+                            .values_list("input_hash", flat=True))
+
+        graphics = []
+        replaced_files = []
+        files = []
+        for graphic_name, (input_hash, values, min_refs, max_refs) in charts_inputs.items():
+            graphic = existing_graphics.get(graphic_name)
+            test_id = test_ids.get(graphic_name)
+            if graphic is not None and graphic.input_hash == input_hash and graphic.test_id_id == test_id:
+                continue
+
+            file_path = f"{graphic_name}_{input_hash}.png"
+            if input_hash not in stored_hashes:
+                files.append((render_chart(graphic_name, values, min_refs, max_refs), file_path))
+                stored_hashes.add(input_hash)
+
+            if graphic is not None and graphic.input_hash != input_hash:
+                replaced_files.append(graphic.graphic.name)
+            graphics.append(Graphic(graphic=file_path, input_hash=input_hash, test_name=graphic_name,
+                                    patient_test_id=patient_test, test_id_id=test_id))
+
+        upload_graphic_files(files)
+        Graphic.objects.bulk_create(graphics, update_conflicts=True, unique_fields=["patient_test_id", "test_name"],
+                                    update_fields=["graphic", "input_hash", "test_id"])
+        mark_orphan_graphic_files(replaced_files)
+
+
+def mark_orphan_graphic_files(file_paths):
+    OrphanGraphicFile.objects.bulk_create([OrphanGraphicFile(graphic=file_path) for file_path in set(file_paths)],
+                                          ignore_conflicts=True)
+
+
+def delete_graphic_files(keys):
+    s3, bucket_name = get_s3_and_bucket_name()
+    for i in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+        s3.delete_objects(Bucket=bucket_name, Delete={
+            "Objects": [{"Key": key} for key in keys[i:i + S3_DELETE_BATCH_SIZE]],
+            "Quiet": True,
+        })
+
+
+def sweep_orphan_graphic_files():
+    deleted = 0
+    last_orphan_id = 0
+    while True:
+        created_before = timezone.now() - timedelta(seconds=settings.GRAPHIC_FILES_GRACE_PERIOD)
+        with transaction.atomic():
+            orphans = list(OrphanGraphicFile.objects.select_for_update(skip_locked=True)
+                           .filter(id__gt=last_orphan_id, created_at__lt=created_before)
+                           .order_by("id")[:S3_DELETE_BATCH_SIZE])
+            if not orphans:
+                return deleted
+            last_orphan_id = orphans[-1].id
+
+            file_paths = [orphan.graphic for orphan in orphans]
+            used_file_paths = set(Graphic.objects.select_for_update().filter(graphic__in=file_paths)
+                                  .values_list("graphic", flat=True))
+            keys = [file_path for file_path in file_paths if file_path not in used_file_paths]
+            delete_graphic_files(keys)
+            OrphanGraphicFile.objects.filter(id__in=[orphan.id for orphan in orphans]).delete()
+            deleted += len(keys)
+
+
+def delete_graphic(graphics_to_delete):
+    with transaction.atomic():
+        file_paths = [graphic.graphic.name for graphic in graphics_to_delete]
+        graphics_to_delete.delete()
+        mark_orphan_graphic_files(file_paths)
 
 
 def draw_values_with_other_angle(angles, values, values_not_scaled, ax):
@@ -104,18 +255,24 @@ def make_usable_values(values, labels=None):
     return values
 
 
-def draw_scaled_marks(*mark_values):
-    for mark in mark_values:
-        plt.text(mark[0], mark[1], mark[2], fontsize=8, color="black", ha="center")
+def scale_values(values, scale):
+    return [Decimal(value) / Decimal(divider) for value, divider in zip(values, scale)]
+
+
+def rotate_angles(angles, rotation):
+    if not rotation:
+        return angles
+    return [(angle - rotation) % (2 * np.pi) for angle in angles]
+
 
+def get_radial_limit(*scaled_values):
+    max_value = max(max(values) for values in scaled_values)
+    return max(CHART_MIN_RADIAL_LIMIT, math.ceil(max_value))
 
-def draw_figure_and_axis(angles, values, min_angles, max_angles, min_indicator_values, max_indicator_values):
-    fig, ax = plt.subplots(figsize=(6, 6), subplot_kw={"polar": True})
-    ax.plot(angles, values, color="red", linewidth=2)
-    ax.plot(min_angles, min_indicator_values, linestyle="--", color="green", linewidth=2)
-    ax.plot(max_angles, max_indicator_values, linestyle="--", color="green", linewidth=2)
 
-    return fig, ax
+def draw_scaled_marks(ax, *mark_values):
+    for mark in mark_values:
+        ax.text(mark[0], mark[1], mark[2], fontsize=8, color="black", ha="center")
 
 
 def draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_values,
@@ -127,200 +284,121 @@ def draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_va
     draw_values_with_other_angle(max_angles, max_indicator_values, max_values_not_scaled, ax)
 
 
-def draw_hematological_research(values, patient_test, latest_graphic_id=None):
-    labels = np.array(["CD19/CD4", "LYMF/CD19", "NEU/LYMF", "CD19/CD8"])
-    values_not_scaled = make_usable_values(values)
-    values_scaled = [values[0] / Decimal(0.2), values[1] / Decimal(2),
-                     values[2] / Decimal(0.4), values[3] / Decimal(0.2)]
-    values, angles = make_usable_values(values_scaled, labels)
-
-    hematological_indicators = get_hematological_indicators()
-
-    min_indicator_values, max_indicator_values = get_hematological_refs(hematological_indicators, [0.2, 2, 0.4, 0.2])
+def create_chart_template(panel_name, min_refs, max_refs, radial_limit):
+    panel = CHART_PANELS[panel_name]
+    labels = panel["labels"]
 
-    min_indicator_values, min_angles = make_usable_values(min_indicator_values, labels)
-    max_indicator_values, max_angles = make_usable_values(max_indicator_values, labels)
-
-    fig, ax = draw_figure_and_axis(angles, values, min_angles, max_angles, min_indicator_values, max_indicator_values)
-
-    draw_scaled_marks([0.04, 1.2, "0.2"], [0.02, 2.2, "0.4"], [0.015, 3.2, "0.6"], [0.01, 4.2, "0.8"],
-                      [-1.33, 0.95, "0.2"], [-1.46, 1.95, "0.4"], [-1.50, 2.95, "0.6"], [-1.515, 3.95, "0.8"],
-                      [-3.2, 0.8, "0.4"], [-3.17, 1.8, "0.8"], [-3.16, 2.8, "1.2"], [-3.155, 3.8, "1.6"],
-                      [1.375, 1.05, "2.0"], [1.46, 2.05, "4.0"], [1.5, 3.05, "6.0"], [1.52, 4.05, "8.0"])
-
-    draw_values(angles, values, values_not_scaled, ax)
-
-    draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_values,
-              *get_hematological_refs(hematological_indicators, [None, None, None, None]))
-
-    ax.set_yticklabels([])
-    ax.set_xticks(angles[:-1])
-    ax.set_xticklabels(labels)
+    min_indicator_values, angles = make_usable_values(scale_values(min_refs, panel["scale"]), labels)
+    max_indicator_values = make_usable_values(scale_values(max_refs, panel["scale"]))
+    angles = rotate_angles(angles, panel["rotation"])
 
-    labels_l = ("Результаты", "Нижние референтные значения", "Верхние референтные значения")
-    ax.legend(labels_l, labelspacing=0.1, fontsize="small")
-
-    graphic = save_graphic(fig, "hematological_research", patient_test, latest_graphic_id)
-
-    return graphic
-
-
-def draw_immune_status(values, patient_test, latest_graphic_id=None):
-    labels = np.array(["NEU/CD4", "NEU/CD3", "NEU/LYMF", "NEU/CD8"])
-    values_not_scaled = make_usable_values(values)
-    values_scaled = [values[0] / Decimal(1.0), values[1] / Decimal(0.8), values[2] / Decimal(0.4),
-                     values[3] / Decimal(2.6)]
-    values, angles = make_usable_values(values_scaled, labels)
-
-    immune_indicators = get_immune_indicators()
-
-    min_indicator_values, max_indicator_values = get_immune_refs(immune_indicators, [1, 0.8, 0.4, 2.6])
-
-    min_indicator_values, min_angles = make_usable_values(min_indicator_values, labels)
-    max_indicator_values, max_angles = make_usable_values(max_indicator_values, labels)
-
-    fig, ax = draw_figure_and_axis(angles, values, min_angles, max_angles, min_indicator_values, max_indicator_values)
-
-    draw_scaled_marks([0.04, 1.2, "1.0"], [0.02, 2.2, "2.0"], [0.015, 3.2, "3.0"], [0.01, 4.2, "4.0"],
-                      [-1.33, 0.95, "2.6"], [-1.46, 1.95, "5.2"], [-1.50, 2.95, "7.8"], [-1.515, 3.95, "10.4"],
-                      [-3.2, 0.8, "0.4"], [-3.17, 1.8, "0.8"], [-3.16, 2.8, "1.2"], [-3.155, 3.8, "1.6"],
-                      [1.375, 1.05, "0.8"], [1.46, 2.05, "1.6"], [1.5, 3.05, "2.4"], [1.52, 4.05, "3.2"])
+    fig = Figure(figsize=(6, 6))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(polar=True)
+    result_line, = ax.plot([], [], color="red", linewidth=2, animated=True)
+    ax.plot(angles, min_indicator_values, linestyle="--", color="green", linewidth=2)
+    ax.plot(angles, max_indicator_values, linestyle="--", color="green", linewidth=2)
 
-    draw_values(angles, values, values_not_scaled, ax)
+    draw_scaled_marks(ax, *panel["marks"])
 
-    draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_values,
-              *get_immune_refs(immune_indicators, [None, None, None, None]))
+    draw_refs(ax, angles, angles, min_indicator_values, max_indicator_values, min_refs, max_refs)
 
+    if panel["yticks"] is not None:
+        ax.set_yticks(panel["yticks"])
+    ax.set_ylim(0, radial_limit)
     ax.set_yticklabels([])
     ax.set_xticks(angles[:-1])
     ax.set_xticklabels(labels)
 
-    labels_l = ("Результаты", "Нижние референтные значения", "Верхние референтные значения")
-    ax.legend(labels_l, labelspacing=0.1, fontsize="small")
-
-    graphic = save_graphic(fig, "immune_status", patient_test, latest_graphic_id)
-
-    return graphic
-
-
-def draw_cytokine_status(values, patient_test, latest_graphic_id=None):
-    labels = np.array(["Интерликин", "ФНО", "Интерферон"])
-    values_not_scaled = make_usable_values(values)
-    values_scaled = [values[0] / Decimal(24.0), values[1] / Decimal(24.0), values[2] / Decimal(24.0)]
-    values, angles = make_usable_values(values_scaled, labels)
-
-    min_indicator_values = [80 / Decimal(24.0), 80 / Decimal(24.0), 80 / Decimal(24.0)]
-    max_indicator_values = [120 / Decimal(24.0), 120 / Decimal(24.0), 120 / Decimal(24.0)]
-    min_indicator_values, min_angles = make_usable_values(min_indicator_values, labels)
-    max_indicator_values, max_angles = make_usable_values(max_indicator_values, labels)
-
-    angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in angles]
-    min_angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in min_angles]
-    max_angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in max_angles]
+    ax.legend(CHART_LEGEND_LABELS, labelspacing=0.1, fontsize="small")
 
-    fig, ax = draw_figure_and_axis(angles, values, min_angles, max_angles, min_indicator_values, max_indicator_values)
+    canvas.draw()
 
-    draw_scaled_marks([-0.47, 1.3, "24.0"], [-0.478, 2.3, "48.0"], [-0.489, 3.3, "72.0"], [-0.502, 4.3, "96.0"],
-                      [-2.3, 0.95, "24.0"], [-2.465, 1.95, "48.0"], [-2.51, 2.95, "72.0"], [-2.54, 3.95, "96.0"],
-                      [1.3, 1.05, "24.0"], [1.428, 2.05, "48.0"], [1.467, 3.05, "72.0"], [1.488, 4.05, "96.0"])
+    return {
+        "canvas": canvas,
+        "ax": ax,
+        "angles": angles,
+        "result_line": result_line,
+        "background": canvas.copy_from_bbox(fig.bbox),
+        "lock": threading.Lock(),
+    }
 
-    draw_values(angles, values, values_not_scaled, ax)
 
-    draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_values,
-              [80, 80, 80], [120, 120, 120])
-
-    ax.set_yticklabels([])
-    ax.set_xticks(angles[:-1])
-    ax.set_xticklabels(labels)
+def get_chart_template(panel_name, min_refs, max_refs, radial_limit):
+    key = (panel_name, tuple(str(ref) for ref in min_refs), tuple(str(ref) for ref in max_refs), radial_limit)
+    with chart_templates_lock:
+        template = chart_templates.get(key)
+        if template is not None:
+            chart_templates.move_to_end(key)
+            return template
 
-    labels_l = ("Результаты", "Нижние референтные значения", "Верхние референтные значения")
-    ax.legend(labels_l, labelspacing=0.1, fontsize="small")
+    template = create_chart_template(panel_name, min_refs, max_refs, radial_limit)
 
-    graphic = save_graphic(fig, "cytokine_status", patient_test, latest_graphic_id)
+    with chart_templates_lock:
+        template = chart_templates.setdefault(key, template)
+        chart_templates.move_to_end(key)
+        while len(chart_templates) > CHART_TEMPLATES_MAX_SIZE:
+            chart_templates.popitem(last=False)
 
-    return graphic
+    return template
 
 
-def draw_regeneration_type1(values, patient_test, latest_graphic_id=None):
-    labels = np.array(["Лимфоциты/моноциты", "Нейтрофилы/лимфоциты", "Нейтрофилы/моноциты"])
+def render_chart(panel_name, values, min_refs, max_refs):
+    panel = CHART_PANELS[panel_name]
     values_not_scaled = make_usable_values(values)
-    values_scaled = [values[0] / Decimal(2), values[1] / Decimal(0.58), values[2] / Decimal(3)]
-    values, angles = make_usable_values(values_scaled, labels)
-
-    min_indicator_values = [Decimal(3.4) / Decimal(2),
-                            Decimal(1.89) / Decimal(0.58),
-                            Decimal(6.4) / Decimal(3)]
-    max_indicator_values = [Decimal(6.1) / Decimal(2),
-                            Decimal(2.1) / Decimal(0.58),
-                            Decimal(12.8) / Decimal(3)]
-
-    min_indicator_values, min_angles = make_usable_values(min_indicator_values, labels)
-    max_indicator_values, max_angles = make_usable_values(max_indicator_values, labels)
+    values_scaled = scale_values(values, panel["scale"])
+    radial_limit = get_radial_limit(values_scaled, scale_values(max_refs, panel["scale"]))
+    values_scaled = make_usable_values(values_scaled)
 
-    angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in angles]
-    min_angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in min_angles]
-    max_angles = [(angle - np.pi / 6) % (2 * np.pi) for angle in max_angles]
+    template = get_chart_template(panel_name, min_refs, max_refs, radial_limit)
+    canvas = template["canvas"]
+    ax = template["ax"]
+    angles = template["angles"]
 
-    fig, ax = draw_figure_and_axis(angles, values, min_angles, max_angles, min_indicator_values, max_indicator_values)
-
-    draw_scaled_marks([-0.47, 1.3, "1.85"], [-0.478, 2.3, "3.7"], [-0.489, 3.3, "5.55"], [-0.502, 4.3, "7.4"],
-                      [1.3, 1.05, "0.58"], [1.428, 2.05, "1.16"], [1.467, 3.05, "1.74"], [1.488, 4.05, "2.32"],
-                      [-2.3, 0.95, "3.0"], [-2.465, 1.95, "6.0"], [-2.51, 2.95, "9.0"], [-2.54, 3.95, "12.0"])
-
-    draw_values(angles, values, values_not_scaled, ax)
-
-    draw_refs(ax, min_angles, max_angles, min_indicator_values, max_indicator_values,
-              [Decimal(3.4), Decimal(1.89), Decimal(6.4)], [Decimal(6.1), Decimal(2.1), Decimal(12.8)])
+    buffer = BytesIO()
+    with template["lock"]:
+        canvas.restore_region(template["background"])
 
-    ax.set_yticks([1, 2, 3, 4, 5])
-    ax.set_yticklabels([])
-    ax.set_xticks(angles[:-1])
-    ax.set_xticklabels(labels)
+        template["result_line"].set_data(angles, values_scaled.astype(float))
+        ax.draw_artist(template["result_line"])
 
-    labels_l = ("Результаты", "Нижние референтные значения", "Верхние референтные значения")
-    ax.legend(labels_l, labelspacing=0.1, fontsize="small")
+        annotations = draw_values(angles, values_scaled, values_not_scaled, ax)
+        for annotation in annotations:
+            ax.draw_artist(annotation)
 
-    graphic = save_graphic(fig, "regeneration_type", patient_test, latest_graphic_id)
+        imsave(buffer, np.asarray(canvas.buffer_rgba()), format="png")
 
-    return graphic
+        for annotation in annotations:
+            annotation.remove()
 
+    buffer.seek(0)
 
-def recreate_regeneration_or_cytokine_graphic(test, test_type, analysis, patient_test):
-    graphic_id = Graphic.objects.get(patient_test_id=test.patient_test_id,
-                                     graphic__startswith=test_type).id
-    graphics_to_delete = Graphic.objects.filter(patient_test_id=test.patient_test_id,
-                                                graphic__startswith=test_type)
-    delete_graphic(graphics_to_delete)
+    return buffer
 
-    if test_type == "regeneration_type":
-        draw_regeneration_type1(analysis, patient_test, graphic_id)
-    else:
-        draw_cytokine_status(analysis, patient_test, graphic_id)
 
+def get_charts(patient_test):
+    return get_patient_test_ratios(patient_test)
 
-def recreate_hematological_and_immune_graphic(test, test_type, hematological_and_immune_analysis, patient_test):
-    graphic_id = Graphic.objects.get(patient_test_id=test.patient_test_id,
-                                     graphic__startswith=test_type).id
-    if test_type == "hematological_research":
-        immune_graphic_id = Graphic.objects.get(patient_test_id=test.patient_test_id,
-                                                graphic__startswith="immune_status").id
-    else:
-        immune_graphic_id = Graphic.objects.get(patient_test_id=test.patient_test_id,
-                                                graphic__startswith="hematological_research").id
-    Graphic.objects.filter(Q(patient_test_id=test.patient_test_id),
-                           Q(graphic__startswith="hematological_research")
-                           | Q(graphic__startswith="immune_status")).delete()
-    graphics_to_delete = Graphic.objects.filter(Q(patient_test_id=test.patient_test_id),
-                                                Q(graphic__startswith="hematological_research")
-                                                | Q(graphic__startswith="immune_status"))
-    delete_graphic(graphics_to_delete)
 
-    draw_hematological_research(hematological_and_immune_analysis["hematological_analysis"],
-                                patient_test, graphic_id)
+def get_chart_data(graphic_name, values):
+    panel = CHART_PANELS[graphic_name]
+    min_refs, max_refs = get_default_refs(graphic_name)
+    angles = rotate_angles(np.linspace(0, 2 * np.pi, len(panel["labels"]), endpoint=False).tolist(),
+                           panel["rotation"])
 
-    draw_immune_status(hematological_and_immune_analysis["immune_analysis"],
-                       patient_test, immune_graphic_id)
+    return {
+        "name": graphic_name,
+        "labels": panel["labels"],
+        "angles": angles,
+        "scale": panel["scale"],
+        "values": values,
+        "values_scaled": scale_values(values, panel["scale"]),
+        "min_refs": min_refs,
+        "max_refs": max_refs,
+        "min_refs_scaled": scale_values(min_refs, panel["scale"]),
+        "max_refs_scaled": scale_values(max_refs, panel["scale"]),
+    }
 
 
 def get_graphics_by_patient_test_id(patient_test_id):
-    return Graphic.objects.filter(patient_test_id=patient_test_id)
+    return Graphic.objects.filter(patient_test_id=patient_test_id).select_related("test_id").order_by("id")
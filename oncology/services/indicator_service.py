@@ -1,105 +1,183 @@
+import threading
+import uuid
+from types import MappingProxyType
 from rest_framework.exceptions import NotFound
+from django.conf import settings
+from django.core.cache import cache
 from oncology.models import Indicator
-from .graphic_service import get_refs
+from decimal import Decimal
+
+
+INDICATOR_NAMES = MappingProxyType({
+    "leukocytes": "лейкоциты",
+    "lymphocytes": "лимфоциты",
+    "monocytes": "моноциты",
+    "neutrophils": "нейтрофилы",
+    "eosinophils": "эозинофилы",
+    "basophils": "базофилы",
+    "hemoglobin": "гемоглобин",
+    "hematocrit": "гематокрит",
+    "platelets": "тромбоциты",
+    "erythrocytes": "эритроциты",
+    "avg_erythrocyte_volume": "ср.объем эритроциты",
+    "avg_hem_cont_in_eryth": "ср.сод.гем. в эритроциты",
+    "avg_hem_conc_in_eryth": "ср.конц.гем в эритроциты",
+    "eryth_volume_distr": "распр.эритр. по объему",
+    "ave_platelet_volume": "ср.объем эритроцита",
+    "thrombocrit": "тромбокрит",
+    "thromb_volume_distr": "распр.тромб. по объему",
+    "b_lymphocytes": "б-лимфоциты",
+    "t_cytotoxic_lymphocytes": "т-цитоксические лимфоциты",
+    "t_lymphocytes": "т-лимфоциты",
+    "t_helpers": "т-хелперы",
+    "nk_cells": "nk-клетки",
+    "tnk": "тнк",
+    "active_t_lymphocytes": "активные т-лимфоциты",
+    "igA": "igA",
+    "igG": "igG",
+    "igM": "igM",
+    "circulating_immune_complexes": "циркулирующие имунные комплексы",
+    "nst_test_spontaneous": "нст-тест (спонтанный)",
+    "nst_test_stimulated": "нст-тест (стимулированный)",
+    "leukotytes_bactericidal_activity": "бактерицидная активность лейкоцитов",
+    "neutrophils_absorption_activity": "поглотительная активность нейтрофилов",
+    "monocytes_absorption_activity": "поглотительная активность моноцитов",
+    "cd3_ifny_stimulated": "cd3+ifny+(стимулированный)",
+    "cd3_ifny_spontaneous": "cd3+ifny+(спонтанный)",
+    "cd3_tnfa_stimulated": "cd3+tnfa+(стимулированный)",
+    "cd3_tnfa_spontaneous": "cd3+tnfa+(спонтанный)",
+    "cd3_il2_stimulated": "cd3+il2+(стимулированный)",
+    "cd3_il2_spontaneous": "cd3+il2+(спонтанный)",
+    "cd3_il4_stimulated": "cd3+il4+(стимулированный)",
+    "cd3_il4_spontaneous": "cd3+il4+(спонтанный)",
+    "cd3_negative_ifny_stimulated": "cd3-ifny+(стимулированный)",
+    "cd3_negative_ifny_spontaneous": "cd3-ifny+(спонтанный)",
+})
+
+indicators_registry = None
+indicators_registry_lock = threading.Lock()
+
+
+def get_indicator_values(first, second, val):
+    if val is None:
+        min = first.interval_min / second.interval_min
+        max = first.interval_max / second.interval_max
+    else:
+        min = first.interval_min / second.interval_min / Decimal(val)
+        max = first.interval_max / second.interval_max / Decimal(val)
+    if max > min:
+        return min, max
+    return max, min
+
+
+def get_refs(refs):
+    min_refs = []
+    max_refs = []
+    for ref in refs:
+        min, max = get_indicator_values(ref[0], ref[1], ref[2])
+        min_refs.append(min)
+        max_refs.append(max)
+    return min_refs, max_refs
+
+
+def get_indicators_registry_version():
+    if not settings.INDICATOR_REGISTRY_VERSION_KEY:
+        return None
+    return cache.get(settings.INDICATOR_REGISTRY_VERSION_KEY)
+
+
+def get_indicators_registry():
+    global indicators_registry
+    version = get_indicators_registry_version()
+    registry = indicators_registry
+    if registry is not None and registry["version"] == version:
+        return registry
+    with indicators_registry_lock:
+        if indicators_registry is None or indicators_registry["version"] != version:
+            indicators_registry = {
+                "version": version,
+                "indicators": {indicator.name: indicator for indicator in Indicator.objects.all()},
+                "refs": {},
+            }
+        return indicators_registry
+
+
+def reset_indicators_registry():
+    global indicators_registry
+    with indicators_registry_lock:
+        indicators_registry = None
+    if settings.INDICATOR_REGISTRY_VERSION_KEY:
+        cache.set(settings.INDICATOR_REGISTRY_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_indicator_by_name(indicator_name):
+    try:
+        return get_indicators_registry()["indicators"][indicator_name]
+    except KeyError:
+        raise NotFound("Indicator не существует")
 
 
-def get_hematological_indicators():
-    lymf_indicator = Indicator.objects.get(name="lymphocytes")
-    cd19_indicator = Indicator.objects.get(name="b_lymphocytes")
-    neu_indicator = Indicator.objects.get(name="neutrophils")
-    cd4_indicator = Indicator.objects.get(name="t_helpers")
-    cd8_indicator = Indicator.objects.get(name="t_cytotoxic_lymphocytes")
+def get_indicators_by_names(indicator_names):
+    indicators = get_indicators_registry()["indicators"]
+    try:
+        return {key: indicators[name] for key, name in indicator_names.items()}
+    except KeyError:
+        raise NotFound("Indicator не существует")
 
-    hematological_indicators = {
-        "lymf_indicator": lymf_indicator,
-        "cd19_indicator": cd19_indicator,
-        "neu_indicator": neu_indicator,
-        "cd4_indicator": cd4_indicator,
-        "cd8_indicator": cd8_indicator,
-    }
 
-    return hematological_indicators
+def get_hematological_indicators():
+    return get_indicators_by_names({
+        "lymf_indicator": "lymphocytes",
+        "cd19_indicator": "b_lymphocytes",
+        "neu_indicator": "neutrophils",
+        "cd4_indicator": "t_helpers",
+        "cd8_indicator": "t_cytotoxic_lymphocytes",
+    })
 
 
 def get_immune_indicators():
-    lymf_indicator = Indicator.objects.get(name="lymphocytes")
-    neu_indicator = Indicator.objects.get(name="neutrophils")
-    cd4_indicator = Indicator.objects.get(name="t_helpers")
-    cd8_indicator = Indicator.objects.get(name="t_cytotoxic_lymphocytes")
-    cd3_indicator = Indicator.objects.get(name="t_lymphocytes")
-
-    immune_indicators = {
-        "lymf_indicator": lymf_indicator,
-        "neu_indicator": neu_indicator,
-        "cd4_indicator": cd4_indicator,
-        "cd8_indicator": cd8_indicator,
-        "cd3_indicator": cd3_indicator,
-    }
-
-    return immune_indicators
+    return get_indicators_by_names({
+        "lymf_indicator": "lymphocytes",
+        "neu_indicator": "neutrophils",
+        "cd4_indicator": "t_helpers",
+        "cd8_indicator": "t_cytotoxic_lymphocytes",
+        "cd3_indicator": "t_lymphocytes",
+    })
 
 
 def get_hematological_and_immune_indicators():
-    lymf_indicator = Indicator.objects.get(name="lymphocytes")
-    cd19_indicator = Indicator.objects.get(name="b_lymphocytes")
-    neu_indicator = Indicator.objects.get(name="neutrophils")
-    cd4_indicator = Indicator.objects.get(name="t_helpers")
-    cd8_indicator = Indicator.objects.get(name="t_cytotoxic_lymphocytes")
-    cd3_indicator = Indicator.objects.get(name="t_lymphocytes")
-
-    hematological_and_immune_indicators = {
-        "lymf_indicator": lymf_indicator,
-        "cd19_indicator": cd19_indicator,
-        "neu_indicator": neu_indicator,
-        "cd4_indicator": cd4_indicator,
-        "cd8_indicator": cd8_indicator,
-        "cd3_indicator": cd3_indicator,
-    }
-
-    return hematological_and_immune_indicators
+    return get_indicators_by_names({
+        "lymf_indicator": "lymphocytes",
+        "cd19_indicator": "b_lymphocytes",
+        "neu_indicator": "neutrophils",
+        "cd4_indicator": "t_helpers",
+        "cd8_indicator": "t_cytotoxic_lymphocytes",
+        "cd3_indicator": "t_lymphocytes",
+    })
 
 
 def get_regeneration_indicators():
-    lymf_indicator = Indicator.objects.get(name="lymphocytes")
-    mon_indicator = Indicator.objects.get(name="monocytes")
-    neu_indicator = Indicator.objects.get(name="neutrophils")
-
-    regeneration_indicators = {
-        "lymf_indicator": lymf_indicator,
-        "mon_indicator": mon_indicator,
-        "neu_indicator": neu_indicator,
-    }
-
-    return regeneration_indicators
+    return get_indicators_by_names({
+        "lymf_indicator": "lymphocytes",
+        "mon_indicator": "monocytes",
+        "neu_indicator": "neutrophils",
+    })
 
 
 def get_cytokine_indicators():
-    cd3_il2_stimulated_indicator = Indicator.objects.get(name="cd3_il2_stimulated")
-    cd3_il2_spontaneous_indicator = Indicator.objects.get(name="cd3_il2_spontaneous")
-    cd3_tnfa_stimulated_indicator = Indicator.objects.get(name="cd3_tnfa_stimulated")
-    cd3_tnfa_spontaneous_indicator = Indicator.objects.get(name="cd3_tnfa_spontaneous")
-    cd3_ifny_stimulated_indicator = Indicator.objects.get(name="cd3_ifny_stimulated")
-    cd3_ifny_spontaneous_indicator = Indicator.objects.get(name="cd3_ifny_spontaneous")
-
-    cytokine_indicators = {
-        "cd3_il2_stimulated_indicator": cd3_il2_stimulated_indicator,
-        "cd3_il2_spontaneous_indicator": cd3_il2_spontaneous_indicator,
-        "cd3_tnfa_stimulated_indicator": cd3_tnfa_stimulated_indicator,
-        "cd3_tnfa_spontaneous_indicator": cd3_tnfa_spontaneous_indicator,
-        "cd3_ifny_stimulated_indicator": cd3_ifny_stimulated_indicator,
-        "cd3_ifny_spontaneous_indicator": cd3_ifny_spontaneous_indicator,
-    }
-
-    return cytokine_indicators
+    return get_indicators_by_names({
+        "cd3_il2_stimulated_indicator": "cd3_il2_stimulated",
+        "cd3_il2_spontaneous_indicator": "cd3_il2_spontaneous",
+        "cd3_tnfa_stimulated_indicator": "cd3_tnfa_stimulated",
+        "cd3_tnfa_spontaneous_indicator": "cd3_tnfa_spontaneous",
+        "cd3_ifny_stimulated_indicator": "cd3_ifny_stimulated",
+        "cd3_ifny_spontaneous_indicator": "cd3_ifny_spontaneous",
+    })
 
 
 def get_value_and_indicator(j):
     value = j["value"]
-    indicator_name = j["indicator_name"]
-    try:
-        indicator = Indicator.objects.get(name=indicator_name)
-    except Indicator.DoesNotExist:
-        raise NotFound("Indicator не существует")
+    indicator = get_indicator_by_name(j["indicator_name"])
 
     return value, indicator
 
@@ -122,3 +200,22 @@ def get_immune_refs(immune_indicators, scaled_deleter_values):
         (immune_indicators["neu_indicator"], immune_indicators["cd3_indicator"], scaled_deleter_values[1]),
         (immune_indicators["neu_indicator"], immune_indicators["lymf_indicator"], scaled_deleter_values[2]),
         (immune_indicators["neu_indicator"], immune_indicators["cd8_indicator"], scaled_deleter_values[3])])
+
+
+def get_default_refs(test_name):
+    if test_name == "cytokine_status":
+        return [80, 80, 80], [120, 120, 120]
+    if test_name == "regeneration_type":
+        return [Decimal(3.4), Decimal(1.89), Decimal(6.4)], [Decimal(6.1), Decimal(2.1), Decimal(12.8)]
+
+    refs = get_indicators_registry()["refs"]
+    if test_name not in refs:
+        if test_name == "hematological_research":
+            refs[test_name] = get_hematological_refs(get_hematological_indicators(), [None, None, None, None])
+        else:
+            refs[test_name] = get_immune_refs(get_immune_indicators(), [None, None, None, None])
+    return refs[test_name]
+
+
+def get_indicator_label(indicator_name):
+    return INDICATOR_NAMES.get(indicator_name, indicator_name)
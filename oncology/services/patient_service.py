@@ -1,22 +1,68 @@
-from oncology.models import Patient, PatientTests
-from django.db.models import Prefetch, Q
+from oncology.models import Patient, PatientTests, normalize_name
+from django.conf import settings
+from django.db.models import FilteredRelation, Q
+from rest_framework.exceptions import NotFound
 
 
-def get_tests_for_patient(pk):
-    return Patient.objects.prefetch_related(
-        Prefetch("patienttests_set", queryset=PatientTests.objects.prefetch_related("test_set"))
-    ).get(pk=pk)
+def get_tests_for_patient(pk, date_from=None, date_to=None, limit=None):
+    patient_tests = PatientTests.objects.filter(patient_id=pk)
+    if date_from:
+        patient_tests = patient_tests.filter(analysis_date__gte=date_from)
+    if date_to:
+        patient_tests = patient_tests.filter(analysis_date__lte=date_to)
+    if limit:
+        patient_tests = patient_tests.filter(
+            id__in=patient_tests.order_by("-analysis_date", "-id").values("id")[:limit])
 
+    rows = patient_tests.annotate(listed_test=FilteredRelation("test", condition=~Q(test__name="regeneration_type"))) \
+        .values_list("id", "analysis_date", "listed_test__id", "listed_test__name") \
+        .order_by("analysis_date", "id", "listed_test__id")
 
-def search_patients(first_name, last_name, patronymic, birth_date):
+    patient_tests_data = []
+    for patient_test_id, analysis_date, test_id, name in rows:
+        if not patient_tests_data or patient_tests_data[-1]["id"] != patient_test_id:
+            patient_tests_data.append({"id": patient_test_id, "analysis_date": analysis_date, "tests": []})
+        if test_id is not None:
+            patient_tests_data[-1]["tests"].append({"id": test_id, "name": name})
+
+    if not patient_tests_data and not Patient.objects.filter(pk=pk).exists():
+        raise NotFound("Пациент не существует")
+    return patient_tests_data
+
+
+def get_name_filters(first_name, last_name, patronymic):
     filters = Q()
-    if first_name:
-        filters &= Q(first_name__istartswith=first_name)
-    if last_name:
-        filters &= Q(last_name__istartswith=last_name)
-    if patronymic:
-        filters &= Q(patronymic__istartswith=patronymic)
+    exact = []
+    for field, name in (("last_name_search", last_name), ("first_name_search", first_name),
+                        ("patronymic_search", patronymic)):
+        name = normalize_name(name)
+        if name:
+            filters &= Q(**{f"{field}__startswith": name})
+            exact.append(Q(**{field: name}))
+    return filters, exact
+
+
+def rank_patients(patients, exact, limit):
+    order = ("last_name_search", "first_name_search", "patronymic_search", "id")
+    fields = ("id", "first_name", "last_name", "patronymic", "birth_date")
+    limit = limit or settings.PATIENT_SEARCH_LIMIT
+    if not exact:
+        return list(patients.order_by(*order).values(*fields)[:limit])
+
+    found = list(patients.filter(*exact).order_by(*order).values(*fields)[:limit])
+    if len(found) < limit:
+        found += patients.exclude(*exact).order_by(*order).values(*fields)[:limit - len(found)]
+    return found
+
+
+def search_patients(first_name, last_name, patronymic, birth_date, limit=None):
+    filters, exact = get_name_filters(first_name, last_name, patronymic)
     if birth_date:
         filters &= Q(birth_date=birth_date)
+    return rank_patients(Patient.objects.filter(filters), exact, limit)
+
 
-    return Patient.objects.filter(filters).values("id", "first_name", "last_name", "patronymic", "birth_date")
+def autocomplete_patients(query, limit=None):
+    last_name, first_name, patronymic = (normalize_name(query).split() + ["", ""])[:3]
+    filters, exact = get_name_filters(first_name, last_name, patronymic)
+    return rank_patients(Patient.objects.filter(filters), exact, limit)
@@ -1,13 +1,14 @@
+from django.db import transaction
 from oncology.models import Test, Patient, PatientTests, Analysis
 from rest_framework.exceptions import NotFound
-from oncology.services.graphic_service import draw_hematological_research, draw_immune_status, draw_cytokine_status,\
-    draw_regeneration_type1
+from oncology.services.graphic_job_service import enqueue_graphics
 from oncology.services.result_service import get_regeneration_analysis_and_make_result,\
-    get_hematological_and_immune_analysis_and_make_result, get_cytokine_analysis_and_make_result
+    get_hematological_and_immune_analysis_and_make_result, get_cytokine_analysis_and_make_result, get_cohort_refs
 from oncology.services.indicator_service import get_value_and_indicator
-from oncology.services.test_service import change_hematological_and_immune_values, change_regeneration_values,\
-    change_cytokine_values
-from django.db.models import Q
+from oncology.services.analysis_service import get_analysis_values
+from oncology.services.aggregate_service import update_indicator_aggregates
+from oncology.services.cohort_stats_service import reset_cohort_stats
+from oncology.services.test_service import get_tests_all_types
 
 
 def create_patient_tests(patient, doctor_id, created_at, updated_at, analysis_date):
@@ -31,75 +32,104 @@ def update_patient_tests(patient, doctor_id, updated_at, analysis_date):
 
 
 def create_tests_and_analysises(patient, doctor_id, created_at, updated_at, analysis_date, tests):
-    patient_test = create_patient_tests(patient, doctor_id, created_at, updated_at, analysis_date)
+    tests_values = [(i["name"], [get_value_and_indicator(j) for j in i["analysis"]]) for i in tests]
 
-    for i in tests:
-        name = i["name"]
-        analysises = i["analysis"]
-        test = Test.objects.create(name=name, patient_test_id=patient_test)
-        if name == "hematological_research":
-            regeneration_type_test = Test.objects.create(name="regeneration_type", patient_test_id=patient_test)
-        for j in analysises:
-            value, indicator = get_value_and_indicator(j)
-            Analysis.objects.create(value=value, indicator_id=indicator, test_id=test)
+    with transaction.atomic():
+        patient_test = create_patient_tests(patient, doctor_id, created_at, updated_at, analysis_date)
+
+        test_objects = []
+        analysis_objects = []
+        for name, values in tests_values:
+            test_names = [name]
             if name == "hematological_research":
-                Analysis.objects.create(value=value, indicator_id=indicator,
-                                        test_id=regeneration_type_test)
+                test_names.append("regeneration_type")
+            for test_name in test_names:
+                test = Test(name=test_name, patient_test_id=patient_test)
+                test_objects.append(test)
+                analysis_objects.extend(Analysis(value=value, indicator_id=indicator, test_id=test)
+                                        for value, indicator in values)
+
+        Test.objects.bulk_create(test_objects)
+        Analysis.objects.bulk_create(analysis_objects)
+        update_indicator_aggregates([patient_test.patient_id_id],
+                                    {analysis.indicator_id_id for analysis in analysis_objects})
 
     return patient_test
 
 
 def update_tests_and_analysises(patient, doctor_id, updated_at, analysis_date, tests):
-    patient_test = update_patient_tests(patient, doctor_id, updated_at, analysis_date)
-
+    value_field = Analysis._meta.get_field("value")
+    tests_values = {}
     for i in tests:
-        name = i["name"]
-        analyses = i["analysis"]
-        try:
-            test = Test.objects.get(name=name, patient_test_id=patient_test)
-        except Test.DoesNotExist:
+        tests_values.setdefault(i["name"], {}).update(
+            (indicator.id, value_field.to_python(value))
+            for value, indicator in (get_value_and_indicator(j) for j in i["analysis"]))
+    if "hematological_research" in tests_values:
+        tests_values["regeneration_type"] = tests_values["hematological_research"]
+    analysis_date = PatientTests._meta.get_field("analysis_date").to_python(analysis_date)
+
+    with transaction.atomic():
+        patient_test = update_patient_tests(patient, doctor_id, updated_at, analysis_date)
+
+        hematological_research_tests, immune_status_tests, cytokine_status_tests, regeneration_type_tests \
+            = get_tests_all_types(patient_test)
+        patient_tests = {
+            "hematological_research": hematological_research_tests,
+            "immune_status": immune_status_tests,
+            "cytokine_status": cytokine_status_tests,
+            "regeneration_type": regeneration_type_tests,
+        }
+        if any(patient_tests.get(name) is None for name in tests_values if name != "regeneration_type"):
             raise NotFound("Test не существует")
-        for j in analyses:
-            value, indicator = get_value_and_indicator(j)
-            Analysis.objects.filter(indicator_id=indicator, test_id=test).update(value=value)
-
-            if name == "hematological_research":
-                change_regeneration_values(test, patient_test)
-                change_hematological_and_immune_values(test, patient_test, "hematological_research", "immune_status")
-
-            if name == "immune_status":
-                change_hematological_and_immune_values(test, patient_test, "immune_status", "hematological_research")
-
-            if name == "cytokine_status":
-                change_cytokine_values(test, patient_test)
 
+        test_names = {test.id: test.name for test in patient_tests.values()
+                      if test is not None and test.name in tests_values}
+        changed_analysises = []
+        for analysis in Analysis.objects.filter(test_id__in=test_names):
+            value = tests_values[test_names[analysis.test_id_id]].get(analysis.indicator_id_id)
+            if value is not None and value != analysis.value:
+                analysis.value = value
+                changed_analysises.append(analysis)
+        Analysis.objects.bulk_update(changed_analysises, ["value"])
+
+        if patient_test.analysis_date != analysis_date:
+            update_indicator_aggregates([patient_test.patient_id_id],
+                                        Analysis.objects.filter(test_id__patient_test_id=patient_test)
+                                        .values("indicator_id"))
+            transaction.on_commit(reset_cohort_stats)
+        elif changed_analysises:
+            update_indicator_aggregates([patient_test.patient_id_id],
+                                        {analysis.indicator_id_id for analysis in changed_analysises})
+
+        changed_tests = {test_names[analysis.test_id_id] for analysis in changed_analysises}
+        if not changed_tests:
+            return
+
+        if "regeneration_type" not in changed_tests:
+            regeneration_type_tests = None
+        if not changed_tests & {"hematological_research", "immune_status"}:
+            hematological_research_tests = None
+        if "cytokine_status" not in changed_tests:
+            cytokine_status_tests = None
+
+        make_results_and_enqueue_graphics(patient_test, regeneration_type_tests, hematological_research_tests,
+                                          immune_status_tests, cytokine_status_tests)
+
+
+def make_results_and_enqueue_graphics(patient_test, regeneration_type_tests, hematological_research_tests,
+                                      immune_status_tests, cytokine_status_tests):
+    analysis_values = get_analysis_values(patient_test)
+    cohort_refs = get_cohort_refs(patient_test)
 
-def draw_graphics_and_make_results(patient_test, regeneration_type_tests, hematological_research_tests,
-                                   immune_status_tests, cytokine_status_tests):
     if regeneration_type_tests is not None:
-        regeneration_analysis = get_regeneration_analysis_and_make_result(regeneration_type_tests)
-
-        draw_regeneration_type1(regeneration_analysis, patient_test)
+        get_regeneration_analysis_and_make_result(regeneration_type_tests, analysis_values, cohort_refs)
 
     if hematological_research_tests is not None and immune_status_tests is not None:
-        hematological_and_immune_analysis = get_hematological_and_immune_analysis_and_make_result(
-            hematological_research_tests, immune_status_tests)
-
-        draw_hematological_research(hematological_and_immune_analysis["hematological_analysis"],
-                                    patient_test)
-        draw_immune_status(hematological_and_immune_analysis["immune_analysis"], patient_test)
+        get_hematological_and_immune_analysis_and_make_result(hematological_research_tests, immune_status_tests,
+                                                              analysis_values, cohort_refs)
 
     if cytokine_status_tests is not None:
-        cytokine_analysis = get_cytokine_analysis_and_make_result(cytokine_status_tests)
-
-        draw_cytokine_status(cytokine_analysis, patient_test)
-
-
-def get_patient_tests_by_id(patient_tests_id):
-    return PatientTests.objects.get(id=patient_tests_id)
-
+        get_cytokine_analysis_and_make_result(cytokine_status_tests, analysis_values, cohort_refs)
 
-def get_patient_tests_by_patient_id_and_analysis_date(instance, months):
-    return PatientTests.objects.filter(Q(patient_id_id=instance.patient_test_id.patient_id.id) &
-                                       Q(analysis_date__lt=instance.patient_test_id.analysis_date) &
-                                       Q(analysis_date__month__in=months)).values("id")
+    transaction.on_commit(reset_cohort_stats)
+    enqueue_graphics(patient_test)
@@ -0,0 +1,73 @@
+import numpy as np
+from django.db.models import Q, Count, Min, Max
+from oncology.models import TestRatio
+from .analysis_service import PANEL_RATIOS
+
+
+def get_ratio_names(panel_name):
+    return [name for name, _, _ in PANEL_RATIOS[panel_name]]
+
+
+def save_test_ratios(test, values):
+    TestRatio.objects.bulk_create(
+        [TestRatio(test_id=test, test_name=test.name, name=name, value=value)
+         for name, value in zip(get_ratio_names(test.name), values)],
+        update_conflicts=True, unique_fields=["test_id", "name"], update_fields=["value"])
+
+
+def get_patient_test_ratios(patient_test):
+    test_ratios = {}
+    ratios = TestRatio.objects.filter(test_id__patient_test_id=patient_test).values_list("test_name", "name", "value")
+    for test_name, name, value in ratios:
+        test_ratios.setdefault(test_name, {})[name] = value
+
+    return {panel_name: [test_ratios[panel_name][name] for name in get_ratio_names(panel_name)]
+            for panel_name in PANEL_RATIOS
+            if panel_name in test_ratios and test_ratios[panel_name].keys() >= set(get_ratio_names(panel_name))}
+
+
+def get_test_ratios_array(test_ids, panel_name):
+    names = get_ratio_names(panel_name)
+    column_indexes = {name: index for index, name in enumerate(names)}
+    row_indexes = {test_id: index for index, test_id in enumerate(test_ids)}
+
+    values = np.full((len(row_indexes), len(names)), np.nan)
+    ratios = TestRatio.objects.filter(test_id__in=test_ids, name__in=names).values_list("test_id", "name", "value")
+    for test_id, name, value in ratios:
+        values[row_indexes[test_id], column_indexes[name]] = value
+
+    return values
+
+
+def get_ratio_band_test_ids(test_name, old_min_refs, old_max_refs, min_refs, max_refs):
+    bands = Q()
+    for name, old_min, old_max, new_min, new_max in zip(get_ratio_names(test_name), old_min_refs, old_max_refs,
+                                                         min_refs, max_refs):
+        if old_min != new_min:
+            bands |= Q(name=name, value__range=(min(old_min, new_min), max(old_min, new_min)))
+        if old_max != new_max:
+            bands |= Q(name=name, value__range=(min(old_max, new_max), max(old_max, new_max)))
+    if not bands:
+        return TestRatio.objects.none().values("test_id")
+
+    return TestRatio.objects.filter(bands, test_name=test_name).values("test_id")
+
+
+def get_ratio_outliers(test_name, name, min_value, max_value, by_patients, limit):
+    outside = Q()
+    if min_value is not None:
+        outside |= Q(value__lt=min_value)
+    if max_value is not None:
+        outside |= Q(value__gt=max_value)
+    ratios = TestRatio.objects.filter(outside, test_name=test_name, name=name)
+
+    if by_patients:
+        return ratios.values("test_id__patient_test_id__patient_id",
+                             "test_id__patient_test_id__patient_id__first_name",
+                             "test_id__patient_test_id__patient_id__last_name",
+                             "test_id__patient_test_id__patient_id__patronymic") \
+            .annotate(tests_count=Count("id"), min_value=Min("value"), max_value=Max("value")) \
+            .order_by("test_id__patient_test_id__patient_id__last_name", "test_id__patient_test_id__patient_id")[:limit]
+
+    return ratios.values("value", "test_id", "test_id__patient_test_id", "test_id__patient_test_id__analysis_date",
+                         "test_id__patient_test_id__patient_id").order_by("value", "test_id")[:limit]
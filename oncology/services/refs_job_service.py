@@ -0,0 +1,133 @@
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from oncology.models import RefsChangeJob, PatientTests
+from .result_service import get_tests_by_patient_id_and_name, get_tests_chunks, get_changed_refs, \
+    make_results_by_refs, get_refs_change_tests, save_cohort_refs, get_stored_cohort_refs, get_previous_refs, \
+    PANEL_RATIOS
+
+
+logger = logging.getLogger(__name__)
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is not None:
+            return executor
+        executor = ThreadPoolExecutor(max_workers=settings.CHANGE_REFS_WORKERS, thread_name_prefix="refs-worker")
+    executor.submit(resubmit_refs_change_jobs)
+    return executor
+
+
+def start_refs_change_workers():
+    if executor is None and settings.CHANGE_REFS_WORKERS and settings.CHANGE_REFS_BACKGROUND:
+        get_executor()
+
+
+def resubmit_refs_change_jobs():
+    try:
+        for job_id in RefsChangeJob.objects.filter(get_claimable_filter()).order_by("id") \
+                .values_list("id", flat=True):
+            submit_refs_change_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def create_refs_change_job(instance, doctor_id, request_data):
+    ref_names = [f"{name}_{bound}" for name, _, _ in PANEL_RATIOS.get(instance.name, ()) for bound in ("min", "max")]
+    refs = {ref_name: request_data[ref_name] for ref_name in ref_names if ref_name in request_data}
+    job = RefsChangeJob.objects.create(test_id=instance, doctor_id=doctor_id, refs=refs)
+    transaction.on_commit(lambda: submit_refs_change_job(job.id))
+    return job
+
+
+def submit_refs_change_job(job_id):
+    if not settings.CHANGE_REFS_WORKERS:
+        return
+    get_executor().submit(run_in_executor, job_id)
+
+
+def run_in_executor(job_id):
+    try:
+        process_refs_change_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def get_claimable_filter(statuses=("pending",)):
+    stale_at = timezone.now() - timedelta(seconds=settings.CHANGE_REFS_CLAIM_TIMEOUT)
+    return Q(status__in=statuses) | Q(status="processing", updated_at__lt=stale_at)
+
+
+def claim_refs_change_job(job_id, statuses=("pending",)):
+    return RefsChangeJob.objects.filter(get_claimable_filter(statuses), id=job_id) \
+        .update(status="processing", updated_at=timezone.now()) == 1
+
+
+def process_refs_change_job(job_id, statuses=("pending",)):
+    if not claim_refs_change_job(job_id, statuses):
+        return
+    try:
+        run_refs_change_job(RefsChangeJob.objects.select_related("test_id").get(id=job_id))
+    except Exception:
+        logger.exception("Не удалось изменить реф. значения по заданию %s", job_id)
+        RefsChangeJob.objects.filter(id=job_id).update(status="failed", updated_at=timezone.now())
+        return
+    RefsChangeJob.objects.filter(id=job_id).update(status="ready", updated_at=timezone.now())
+
+
+def run_refs_change_job(job):
+    type_name = job.test_id.name
+    if type_name not in PANEL_RATIOS:
+        return
+    if job.resolved_refs is None:
+        resolve_refs_change_job(job, type_name)
+
+    min_refs = np.array(job.resolved_refs["min_refs"])
+    max_refs = np.array(job.resolved_refs["max_refs"])
+    previous_refs = job.resolved_refs["previous_refs"]
+    tests = get_refs_change_tests(job.test_id, type_name, previous_refs, min_refs, max_refs)
+
+    for chunk in get_tests_chunks(tests, job.last_test_id):
+        with transaction.atomic():
+            make_results_by_refs(chunk, type_name, min_refs, max_refs)
+            RefsChangeJob.objects.filter(id=job.id).update(processed=F("processed") + len(chunk),
+                                                           last_test_id=chunk[-1], updated_at=timezone.now())
+
+
+def resolve_refs_change_job(job, type_name):
+    with transaction.atomic():
+        cohort_refs = get_stored_cohort_refs(job.test_id, type_name)
+        min_refs, max_refs = get_changed_refs(cohort_refs, type_name, job.refs)
+        previous_refs = get_previous_refs(cohort_refs)
+        save_cohort_refs(job.test_id, type_name, min_refs, max_refs)
+
+        job.resolved_refs = {"min_refs": min_refs.tolist(), "max_refs": max_refs.tolist(),
+                             "previous_refs": previous_refs}
+        tests = get_refs_change_tests(job.test_id, type_name, previous_refs, min_refs, max_refs)
+        RefsChangeJob.objects.filter(id=job.id).update(resolved_refs=job.resolved_refs, total=tests.count(),
+                                                       processed=0, last_test_id=0, updated_at=timezone.now())
+        job.last_test_id = 0
+
+
+def get_refs_change_job_progress(job):
+    tests = get_tests_by_patient_id_and_name(job.test_id, job.test_id.name)
+    charts_pending = PatientTests.objects.filter(id__in=tests.values("patient_test_id"),
+                                                 graphic_status__in=("pending", "processing")).count()
+    return {
+        "id": job.id,
+        "status": job.status,
+        "processed": job.processed,
+        "total": job.total,
+        "charts_pending": charts_pending,
+    }
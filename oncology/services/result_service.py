@@ -1,59 +1,157 @@
-from decimal import Decimal
-from oncology.models import Test
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from oncology.models import Test, Patient, PatientTests, CohortRefs
 from oncology.services.analysis_service import get_hematological_and_immune_analysis, get_regeneration_analysis, \
-    get_cytokine_analysis
-from oncology.services.indicator_service import get_regeneration_indicators, get_hematological_and_immune_indicators, \
-    get_hematological_refs, get_immune_refs, get_cytokine_indicators
-from oncology.services.test_service import change_hematological_refs, change_regeneration_refs,\
-    change_immune_refs, change_cytokine_refs, get_tests_by_patient_id_and_name
+    get_cytokine_analysis, PANEL_RATIOS
+from oncology.services.indicator_service import get_default_refs
+from oncology.services.ratio_service import save_test_ratios, get_test_ratios_array, get_ratio_band_test_ids
+from oncology.services.cohort_stats_service import reset_cohort_stats
+
+
+ABNORMAL_CONCLUSION = "значения с отклонениями от нормы"
+NORMAL_CONCLUSION = "значения в пределах нормы"
+CHANGE_REFS_CHUNK_SIZE = 2000
 
 
 def get_analysis_result(tests: Test, values, min_values, max_values):
+    save_test_ratios(tests, values)
     for i in range(len(values)):
         if not (min_values[i] <= values[i] <= max_values[i]):
-            tests.conclusion = "значения с отклонениями от нормы"
+            tests.conclusion = ABNORMAL_CONCLUSION
             tests.recommendations = "test"
             tests.save()
             return
-    tests.conclusion = "значения в пределах нормы"
+    tests.conclusion = NORMAL_CONCLUSION
     tests.recommendations = "test"
     tests.save()
 
 
 def save_conclusion_and_recommendations(instance, type_name, request_data):
+    recommendations = request_data["recommendations"]
+    conclusion = request_data["conclusion"]
+    tests = get_tests_by_patient_id_and_name(instance, type_name) \
+        .exclude(recommendations=recommendations, conclusion=conclusion)
+
+    updated = 0
+    for chunk in get_tests_chunks(tests):
+        updated += Test.objects.filter(id__in=chunk).update(recommendations=recommendations, conclusion=conclusion)
+    if updated:
+        CohortRefs.objects.filter(diagnosis=instance.patient_test_id.patient_id.diagnosis, test_name=type_name) \
+            .update(needs_full_pass=True)
+    return updated
+
+
+def get_stored_cohort_refs(instance, type_name):
+    return CohortRefs.objects.select_for_update().filter(diagnosis=instance.patient_test_id.patient_id.diagnosis,
+                                                         test_name=type_name).first()
+
+
+def get_previous_refs(cohort_refs):
+    if cohort_refs is None or cohort_refs.needs_full_pass:
+        return None
+    return cohort_refs.min_refs, cohort_refs.max_refs
+
+
+def get_changed_refs(cohort_refs, type_name, request_data):
+    if cohort_refs is None:
+        current_min_refs, current_max_refs = get_default_refs(type_name)
+    else:
+        current_min_refs, current_max_refs = cohort_refs.min_refs, cohort_refs.max_refs
+    names = [name for name, _, _ in PANEL_RATIOS[type_name]]
+    min_refs = [float(request_data.get(f"{name}_min", ref)) for name, ref in zip(names, current_min_refs)]
+    max_refs = [float(request_data.get(f"{name}_max", ref)) for name, ref in zip(names, current_max_refs)]
+
+    return np.array(min_refs), np.array(max_refs)
+
+
+def get_cohort_refs(patient_test):
+    cohort_refs = {test_name: get_default_refs(test_name) for test_name in PANEL_RATIOS}
+    stored_refs = CohortRefs.objects.filter(
+        diagnosis__in=Patient.objects.filter(patienttests=patient_test).values("diagnosis"))
+    for refs in stored_refs:
+        cohort_refs[refs.test_name] = refs.min_refs, refs.max_refs
+
+    return cohort_refs
+
+
+def get_refs_change_tests(instance, type_name, previous_refs, min_refs, max_refs):
     tests = get_tests_by_patient_id_and_name(instance, type_name)
-    for test in tests:
-        test.recommendations = request_data["recommendations"]
-        test.conclusion = request_data["conclusion"]
-        test.save()
+    if previous_refs is None:
+        return tests
+
+    previous_min_refs, previous_max_refs = previous_refs
+    return tests.filter(id__in=get_ratio_band_test_ids(type_name, previous_min_refs, previous_max_refs,
+                                                       min_refs.tolist(), max_refs.tolist()))
+
+
+def save_cohort_refs(instance, type_name, min_refs, max_refs):
+    CohortRefs.objects.update_or_create(diagnosis=instance.patient_test_id.patient_id.diagnosis,
+                                        test_name=type_name,
+                                        defaults={"min_refs": min_refs.tolist(), "max_refs": max_refs.tolist(),
+                                                  "needs_full_pass": False})
+    transaction.on_commit(reset_cohort_stats)
+
+
+def make_results_by_refs(test_ids, type_name, min_refs, max_refs):
+    ratios = get_test_ratios_array(test_ids, type_name)
+
+    evaluated = ~np.isnan(ratios).any(axis=1)
+    abnormal = ((ratios < min_refs) | (ratios > max_refs)).any(axis=1)
+    abnormal_ids = [test_id for test_id, is_evaluated, is_abnormal in zip(test_ids, evaluated, abnormal)
+                    if is_evaluated and is_abnormal]
+    normal_ids = [test_id for test_id, is_evaluated, is_abnormal in zip(test_ids, evaluated, abnormal)
+                  if is_evaluated and not is_abnormal]
+
+    return Test.objects.filter(Q(id__in=abnormal_ids) & ~Q(conclusion=ABNORMAL_CONCLUSION)
+                               | Q(id__in=normal_ids) & ~Q(conclusion=NORMAL_CONCLUSION)).update(
+        conclusion=Case(When(id__in=abnormal_ids, then=Value(ABNORMAL_CONCLUSION)), default=Value(NORMAL_CONCLUSION)),
+        recommendations="test")
+
+
+def get_tests_chunks(tests, last_test_id=0):
+    while True:
+        chunk = list(tests.filter(id__gt=last_test_id).order_by("id")
+                     .values_list("id", flat=True)[:CHANGE_REFS_CHUNK_SIZE])
+        if not chunk:
+            return
+        yield chunk
+        last_test_id = chunk[-1]
 
 
 def change_refs(instance, type_name, request_data):
-    tests = get_tests_by_patient_id_and_name(instance, type_name)
-    if type_name == "hematological_research":
-        for test in tests:
-            change_hematological_refs(request_data, test)
-    if type_name == "immune_status":
-        for test in tests:
-            change_immune_refs(request_data, test)
-    if type_name == "cytokine_status":
-        for test in tests:
-            change_cytokine_refs(request_data, test)
-    if type_name == "regeneration_type":
-        for test in tests:
-            change_regeneration_refs(request_data, test)
-
-
-def get_hematological_and_immune_analysis_and_make_result(hematological_research_tests, immune_status_tests):
-    hematological_and_immune_indicators = get_hematological_and_immune_indicators()
-    hematological_and_immune_analysis = get_hematological_and_immune_analysis(
-        hematological_research_tests, immune_status_tests, hematological_and_immune_indicators)
-
-    hematological_research_min, hematological_research_max = get_hematological_refs(
-        hematological_and_immune_indicators, [None, None, None, None])
-
-    immune_status_min, immune_status_max = get_immune_refs(hematological_and_immune_indicators,
-                                                           [None, None, None, None])
+    if type_name not in PANEL_RATIOS:
+        return
+    with transaction.atomic():
+        cohort_refs = get_stored_cohort_refs(instance, type_name)
+        min_refs, max_refs = get_changed_refs(cohort_refs, type_name, request_data)
+        save_cohort_refs(instance, type_name, min_refs, max_refs)
+        tests = get_refs_change_tests(instance, type_name, get_previous_refs(cohort_refs), min_refs, max_refs)
+        for chunk in get_tests_chunks(tests):
+            make_results_by_refs(chunk, type_name, min_refs, max_refs)
+
+
+def make_patient_results_by_cohort_refs(patient):
+    test_ids = {}
+    for test_id, test_name in Test.objects.filter(patient_test_id__patient_id=patient, name__in=PANEL_RATIOS) \
+            .values_list("id", "name"):
+        test_ids.setdefault(test_name, []).append(test_id)
+    stored_refs = {refs.test_name: (refs.min_refs, refs.max_refs)
+                   for refs in CohortRefs.objects.filter(diagnosis=patient.diagnosis, test_name__in=test_ids)}
+
+    for test_name, ids in test_ids.items():
+        min_refs, max_refs = stored_refs.get(test_name) or get_default_refs(test_name)
+        make_results_by_refs(ids, test_name, np.array(min_refs, dtype=float), np.array(max_refs, dtype=float))
+    transaction.on_commit(reset_cohort_stats)
+
+
+def get_hematological_and_immune_analysis_and_make_result(hematological_research_tests, immune_status_tests,
+                                                          analysis_values, cohort_refs):
+    hematological_and_immune_analysis = get_hematological_and_immune_analysis(analysis_values)
+
+    hematological_research_min, hematological_research_max = cohort_refs["hematological_research"]
+
+    immune_status_min, immune_status_max = cohort_refs["immune_status"]
 
     get_analysis_result(hematological_research_tests,
                         hematological_and_immune_analysis["hematological_analysis"],
@@ -66,13 +164,10 @@ def get_hematological_and_immune_analysis_and_make_result(hematological_research
     return hematological_and_immune_analysis
 
 
-def get_regeneration_analysis_and_make_result(regeneration_type_tests):
-    regeneration_indicators = get_regeneration_indicators()
-
-    regeneration_analysis = get_regeneration_analysis(regeneration_type_tests, regeneration_indicators)
+def get_regeneration_analysis_and_make_result(regeneration_type_tests, analysis_values, cohort_refs):
+    regeneration_analysis = get_regeneration_analysis(analysis_values)
 
-    regeneration_type_min = [Decimal(3.4), Decimal(1.89), Decimal(6.4)]
-    regeneration_type_max = [Decimal(6.1), Decimal(2.1), Decimal(12.8)]
+    regeneration_type_min, regeneration_type_max = cohort_refs["regeneration_type"]
 
     get_analysis_result(regeneration_type_tests, regeneration_analysis,
                         regeneration_type_min, regeneration_type_max)
@@ -80,14 +175,25 @@ def get_regeneration_analysis_and_make_result(regeneration_type_tests):
     return regeneration_analysis
 
 
-def get_cytokine_analysis_and_make_result(cytokine_status_tests):
-    cytokine_indicators = get_cytokine_indicators()
+def get_cytokine_analysis_and_make_result(cytokine_status_tests, analysis_values, cohort_refs):
+    cytokine_analysis = get_cytokine_analysis(analysis_values)
 
-    cytokine_analysis = get_cytokine_analysis(cytokine_status_tests, cytokine_indicators)
-
-    cytokine_status_min = [80, 80, 80]
-    cytokine_status_max = [120, 120, 120]
+    cytokine_status_min, cytokine_status_max = cohort_refs["cytokine_status"]
 
     get_analysis_result(cytokine_status_tests, cytokine_analysis, cytokine_status_min, cytokine_status_max)
 
     return cytokine_analysis
+
+
+def get_tests_by_patient_id_and_name(instance, type_name):
+    instance_patient = Patient.objects.get(id=instance.patient_test_id.patient_id.id)
+    patients = Patient.objects.filter(diagnosis=instance_patient.diagnosis).values_list("id", flat=True)
+    if type_name == "hematological_research" or type_name == "immune_status":
+        patient_tests = PatientTests.objects.filter(patient_id__id__in=patients, test__name="hematological_research"
+                                                    ).filter(test__name="immune_status").values_list("id",
+                                                                                                     flat=True)
+        tests = Test.objects.filter(patient_test_id__in=patient_tests, name=type_name)
+    else:
+        tests = Test.objects.filter(patient_test_id__patient_id__id__in=patients, name=type_name)
+
+    return tests
@@ -0,0 +1,56 @@
+from django.db.models import Avg, Count, DateField, F, Max, Min
+from django.db.models.functions import Trunc
+from oncology.models import Analysis, TestRatio
+
+
+TIME_SERIES_BUCKETS = ("month", "quarter", "year")
+
+
+def filter_by_dates(queryset, date_from, date_to):
+    if date_from:
+        queryset = queryset.filter(test_id__patient_test_id__analysis_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(test_id__patient_test_id__analysis_date__lte=date_to)
+    return queryset
+
+
+def get_series_points(queryset, keys, bucket):
+    if bucket is None:
+        return queryset.annotate(date=F("test_id__patient_test_id__analysis_date")) \
+            .values(*keys, "date", "value", "test_id__patient_test_id").order_by(*keys, "date", "id")
+
+    return queryset.annotate(date=Trunc("test_id__patient_test_id__analysis_date", bucket, output_field=DateField())) \
+        .values(*keys, "date").annotate(count=Count("id"), min_value=Min("value"), max_value=Max("value"),
+                                        avg_value=Avg("value")).order_by(*keys, "date")
+
+
+def make_series(points, keys, bucket):
+    series = {}
+    for point in points:
+        key = tuple(point[name] for name in keys)
+        if bucket is None:
+            value = {"date": point["date"], "value": point["value"],
+                     "patient_test_id": point["test_id__patient_test_id"]}
+        else:
+            value = {"date": point["date"], "count": point["count"], "min_value": point["min_value"],
+                     "max_value": point["max_value"], "avg_value": round(point["avg_value"], 2)}
+        series.setdefault(key, []).append(value)
+    return series
+
+
+def get_indicators_time_series(patient_id, indicator_names, bucket=None, date_from=None, date_to=None):
+    analysises = filter_by_dates(Analysis.objects.filter(test_id__patient_test_id__patient_id=patient_id,
+                                                         indicator_id__name__in=indicator_names)
+                                 .exclude(test_id__name="regeneration_type"), date_from, date_to)
+    keys = ("indicator_id__name",)
+    series = make_series(get_series_points(analysises, keys, bucket), keys, bucket)
+    return [{"name": name, "points": series.get((name,), [])} for name in indicator_names]
+
+
+def get_ratios_time_series(patient_id, ratio_names, bucket=None, date_from=None, date_to=None):
+    ratios = filter_by_dates(TestRatio.objects.filter(test_id__patient_test_id__patient_id=patient_id,
+                                                      name__in=ratio_names), date_from, date_to)
+    keys = ("test_name", "name")
+    series = make_series(get_series_points(ratios, keys, bucket), keys, bucket)
+    return [{"test_name": test_name, "name": name, "points": points}
+            for (test_name, name), points in series.items()]
@@ -0,0 +1,38 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from oncology.models import Indicator, Analysis, Patient, Test
+from oncology.services.indicator_service import reset_indicators_registry
+from oncology.services.graphic_job_service import start_graphic_workers
+from oncology.services.refs_job_service import start_refs_change_workers
+from oncology.services.aggregate_service import update_indicator_aggregates
+from oncology.services.cohort_stats_service import reset_cohort_stats
+
+
+@receiver([post_save, post_delete], sender=Indicator)
+def reset_indicators_registry_on_change(sender, **kwargs):
+    reset_indicators_registry()
+    transaction.on_commit(reset_indicators_registry)
+    transaction.on_commit(reset_cohort_stats)
+
+
+@receiver([post_save, post_delete], sender=Analysis)
+def update_indicator_aggregates_on_change(sender, instance, **kwargs):
+    patient_id = Test.objects.filter(id=instance.test_id_id) \
+        .values_list("patient_test_id__patient_id", flat=True).first()
+    if patient_id is None:
+        return
+    update_indicator_aggregates([patient_id], [instance.indicator_id_id])
+    transaction.on_commit(reset_cohort_stats)
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def reset_cohort_stats_on_patient_change(sender, **kwargs):
+    transaction.on_commit(reset_cohort_stats)
+
+
+@receiver(request_started)
+def start_workers_on_request(sender, **kwargs):
+    start_graphic_workers()
+    start_refs_change_workers()
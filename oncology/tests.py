@@ -1,3 +1,637 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datetime import date, timedelta
+from io import BytesIO
+from unittest import mock
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
+from oncology.models import Doctor, Patient, PatientTests, Indicator, Graphic, Test, Analysis, CohortRefs, \
+    RefsChangeJob, OrphanGraphicFile, IndicatorAggregate, TestRatio
+from oncology.services.aggregate_service import rebuild_indicator_aggregates
+from oncology.services.analysis_service import get_analysis_comparison
+from oncology.services.cohort_stats_service import get_cohort_stats, reset_cohort_stats
+from oncology.services.graphic_job_service import process_patient_tests_graphics, submit_graphics, \
+    patient_tests_in_progress
+from oncology.services.graphic_service import save_graphics, get_charts
+from oncology.services.indicator_service import reset_indicators_registry, get_indicator_label
+from oncology.services.patient_service import search_patients, autocomplete_patients, get_tests_for_patient
+from oncology.services.patient_test_service import create_tests_and_analysises, make_results_and_enqueue_graphics, \
+    update_tests_and_analysises
+from oncology.services.refs_job_service import create_refs_change_job, resolve_refs_change_job, \
+    process_refs_change_job
+from oncology.services.result_service import ABNORMAL_CONCLUSION, NORMAL_CONCLUSION, make_results_by_refs
+from oncology.services.test_service import get_tests_all_types
+from oncology.services.time_series_service import get_indicators_time_series, get_ratios_time_series
 
-# Create your tests here.
+
+INDICATORS = {
+    "hematological_research": {"lymphocytes": (1.2, 3.0, 2.0), "monocytes": (0.1, 0.6, 0.4),
+                               "neutrophils": (1.8, 6.5, 4.0)},
+    "immune_status": {"b_lymphocytes": (0.1, 0.5, 0.3), "t_helpers": (0.5, 1.2, 0.9),
+                      "t_cytotoxic_lymphocytes": (0.3, 0.8, 0.5), "t_lymphocytes": (0.8, 2.2, 1.5)},
+    "cytokine_status": {"cd3_il2_stimulated": (10, 50, 30), "cd3_il2_spontaneous": (1, 5, 2),
+                        "cd3_tnfa_stimulated": (10, 50, 30), "cd3_tnfa_spontaneous": (1, 5, 2),
+                        "cd3_ifny_stimulated": (10, 50, 30), "cd3_ifny_spontaneous": (1, 5, 2)},
+}
+
+
+def create_doctor():
+    return Doctor.objects.create_user("Иван", "Петров", "Сергеевич", "password", "doctor@example.com",
+                                      is_active=True)
+
+
+def create_patient(last_name="Петров", first_name="Иван", diagnosis="C50"):
+    return Patient.objects.create(first_name=first_name, last_name=last_name, patronymic="Сергеевич",
+                                  birth_date=date(1970, 1, 1), diagnosis=diagnosis, region="Свердловская")
+
+
+def create_indicators():
+    for indicators in INDICATORS.values():
+        for name, (interval_min, interval_max, _) in indicators.items():
+            Indicator.objects.create(name=name, interval_min=interval_min, interval_max=interval_max, unit="10E9/л")
+
+
+def create_patient_test(patient, doctor, test_names=INDICATORS):
+    tests = [{"name": name, "analysis": [{"indicator_name": indicator_name, "value": value}
+                                         for indicator_name, (_, _, value) in INDICATORS[name].items()]}
+             for name in test_names]
+    now = timezone.now()
+    patient_test = create_tests_and_analysises(patient.id, doctor, now, now, "2024-03-24", tests)
+    with override_settings(GRAPHIC_RENDERING="off"):
+        make_results_and_enqueue_graphics(patient_test, *get_regeneration_first(patient_test))
+    return patient_test
+
+
+def get_regeneration_first(patient_test):
+    hematological_research_tests, immune_status_tests, cytokine_status_tests, regeneration_type_tests \
+        = get_tests_all_types(patient_test)
+    return regeneration_type_tests, hematological_research_tests, immune_status_tests, cytokine_status_tests
+
+
+def run_in_threads(target, *args_list):
+    barrier = threading.Barrier(len(args_list))
+    errors = []
+
+    def run(*args):
+        try:
+            barrier.wait()
+            target(*args)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@mock.patch("oncology.services.graphic_service.upload_graphic_files")
+@mock.patch("oncology.services.graphic_service.render_chart", side_effect=lambda *args: BytesIO(b"png"))
+class GraphicConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("Потокам нужна общая тестовая база: PostgreSQL или SQLite с DATABASES TEST NAME")
+        create_indicators()
+        self.patient_test = create_patient_test(create_patient(), create_doctor())
+        self.panels = set(get_charts(self.patient_test))
+
+    def test_concurrent_claims_render_once(self, render_chart, upload_graphic_files):
+        PatientTests.objects.filter(id=self.patient_test.id).update(graphic_status="pending")
+
+        errors = run_in_threads(process_patient_tests_graphics, (self.patient_test.id,), (self.patient_test.id,))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(render_chart.call_count, len(self.panels))
+        self.assertEqual(sorted(Graphic.objects.filter(patient_test_id=self.patient_test)
+                                .values_list("test_name", flat=True)), sorted(self.panels))
+        self.assertEqual(PatientTests.objects.get(id=self.patient_test.id).graphic_status, "ready")
+
+    def test_concurrent_saves_keep_one_graphic_per_panel(self, render_chart, upload_graphic_files):
+        charts = get_charts(self.patient_test)
+
+        errors = run_in_threads(save_graphics, *[(self.patient_test, charts)] * 4)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(Graphic.objects.filter(patient_test_id=self.patient_test)
+                                .values_list("test_name", flat=True)), sorted(self.panels))
+
+    def test_concurrent_saves_with_different_inputs(self, render_chart, upload_graphic_files):
+        charts = get_charts(self.patient_test)
+        other_charts = {graphic_name: [value * 2 for value in values] for graphic_name, values in charts.items()}
+
+        errors = run_in_threads(save_graphics, *[(self.patient_test, charts), (self.patient_test, other_charts)] * 2)
+
+        self.assertEqual(errors, [])
+        graphics = Graphic.objects.filter(patient_test_id=self.patient_test)
+        self.assertEqual(sorted(graphics.values_list("test_name", flat=True)), sorted(self.panels))
+        uploaded_files = {file_path for call in upload_graphic_files.call_args_list for _, file_path in call.args[0]}
+        self.assertEqual(len(uploaded_files), 2 * len(self.panels))
+        self.assertEqual(uploaded_files, set(graphics.values_list("graphic", flat=True))
+                         | set(OrphanGraphicFile.objects.values_list("graphic", flat=True)))
+
+
+class GraphicSubmitTests(SimpleTestCase):
+    def test_submit_does_not_wait_for_running_claim(self):
+        claim_started = threading.Event()
+        release_claim = threading.Event()
+        claims = []
+
+        def claim(patient_test_id, statuses=("pending",)):
+            claims.append(patient_test_id)
+            claim_started.set()
+            release_claim.wait(5)
+            return False
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch("oncology.services.graphic_job_service.claim_patient_tests", side_effect=claim), \
+                mock.patch("oncology.services.graphic_job_service.get_executor", return_value=executor), \
+                mock.patch("oncology.services.graphic_job_service.close_old_connections"):
+            submit_graphics(1)
+            self.assertTrue(claim_started.wait(5))
+
+            started = time.monotonic()
+            submit_graphics(1)
+            self.assertLess(time.monotonic() - started, 1)
+
+            release_claim.set()
+            executor.shutdown(wait=True)
+
+        self.assertEqual(claims, [1, 1])
+        self.assertNotIn(1, patient_tests_in_progress)
+
+
+class PatientPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor()
+        Patient.objects.bulk_create(
+            [Patient(first_name=f"Иван{i}", last_name="Иванов", patronymic="Иванович", birth_date=date(1970, 1, 1),
+                     diagnosis="C50", region="Свердловская") for i in range(1500)]
+            + [Patient(first_name="Пётр", last_name=last_name, patronymic="Петрович", birth_date=date(1970, 1, 1),
+                       diagnosis="C50", region="Свердловская") for last_name in ("Абрамов", "Яковлев")])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def get_pages(self, url, link):
+        pages = []
+        while url:
+            self.assertLessEqual(len(pages), Patient.objects.count() // 100, "Страницы повторяются")
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([patient["id"] for patient in response.data["results"]])
+            url = response.data[link]
+        return pages
+
+    def test_pages_cover_shared_last_name_without_duplicates(self):
+        expected = list(Patient.objects.order_by("last_name", "id").values_list("id", flat=True))
+
+        pages = self.get_pages("/api/v1/patients-info/?page_size=100&fields=id", "next")
+
+        self.assertEqual(len(pages), 16)
+        self.assertEqual([patient_id for page in pages for patient_id in page], expected)
+
+        last_page = self.client.get("/api/v1/patients-info/?page_size=100&fields=id").data
+        for _ in pages[1:]:
+            last_page = self.client.get(last_page["next"]).data
+        previous_pages = self.get_pages(last_page["previous"], "previous")
+
+        self.assertEqual([patient_id for page in reversed(previous_pages) for patient_id in page],
+                         expected[:-len(last_page["results"])])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/patients-info/?cursor=broken")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientSearchTests(TestCase):
+    def get_search_names(self, patient):
+        return Patient.objects.filter(id=patient.id) \
+            .values_list("last_name_search", "first_name_search", "patronymic_search").get()
+
+    def test_search_names_are_filled_on_bulk_paths(self):
+        patient, = Patient.objects.bulk_create([Patient(first_name=" Пётр ", last_name="ЁЛКИН", patronymic="Ильич",
+                                                        birth_date=date(1970, 1, 1), diagnosis="C50",
+                                                        region="Свердловская")])
+        self.assertEqual(self.get_search_names(patient), ("елкин", "петр", "ильич"))
+
+        Patient.objects.filter(id=patient.id).update(last_name="Иванов")
+        self.assertEqual(self.get_search_names(patient), ("иванов", "петр", "ильич"))
+
+        patient.first_name = "Семён"
+        Patient.objects.bulk_update([patient], ["first_name"])
+        self.assertEqual(self.get_search_names(patient), ("иванов", "семен", "ильич"))
+
+        patient.patronymic = "Фёдорович"
+        patient.save(update_fields=["patronymic"])
+        self.assertEqual(self.get_search_names(patient), ("иванов", "семен", "федорович"))
+
+    def test_exact_matches_fill_limit_before_prefix_matches(self):
+        exact = [create_patient("Петров", "Иван").id for _ in range(2)]
+        prefix = create_patient("Петрова", "Ивана").id
+
+        with self.assertNumQueries(1):
+            self.assertEqual([patient["id"] for patient in search_patients("иван", "ПЕТРОВ", "", "", limit=2)], exact)
+        with self.assertNumQueries(2):
+            self.assertEqual([patient["id"] for patient in search_patients("Иван", "Петров", "", "", limit=5)],
+                             exact + [prefix])
+        self.assertEqual([patient["id"] for patient in autocomplete_patients("петров ив", limit=5)], exact + [prefix])
+
+
+class PatientTestsListTests(TestCase):
+    def test_patient_tests_without_listed_tests_keep_their_limit_slot(self):
+        create_indicators()
+        doctor = create_doctor()
+        patient = create_patient()
+        older = create_patient_test(patient, doctor, ["cytokine_status"])
+        latest = create_patient_test(patient, doctor, ["immune_status"])
+        regeneration_only = PatientTests.objects.create(analysis_date=date(2024, 3, 25), created_at=timezone.now(),
+                                                        updated_at=timezone.now(), doctor_id=doctor,
+                                                        patient_id=patient)
+        Test.objects.create(name="regeneration_type", patient_test_id=regeneration_only)
+
+        self.assertEqual([(patient_test["id"], [test["name"] for test in patient_test["tests"]])
+                          for patient_test in get_tests_for_patient(patient.id, limit=2)],
+                         [(latest.id, ["immune_status"]), (regeneration_only.id, [])])
+        self.assertEqual([patient_test["id"] for patient_test in get_tests_for_patient(patient.id)],
+                         [older.id, latest.id, regeneration_only.id])
+
+
+class ChangeRefsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_indicators()
+        cls.doctor = create_doctor()
+        cls.patient = create_patient()
+        CohortRefs.objects.create(diagnosis="C50", test_name="cytokine_status", min_refs=[10, 10, 10],
+                                  max_refs=[20, 20, 20])
+        CohortRefs.objects.create(diagnosis="C61", test_name="cytokine_status", min_refs=[0, 0, 0],
+                                  max_refs=[12, 12, 12])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+        self.test = Test.objects.get(patient_test_id=create_patient_test(self.patient, self.doctor),
+                                     name="cytokine_status")
+
+    def get_conclusion(self, test=None):
+        return Test.objects.get(id=(test or self.test).id).conclusion
+
+    def test_diagnosis_change_moves_tests_to_new_cohort_refs(self):
+        self.assertEqual(self.get_conclusion(), NORMAL_CONCLUSION)
+
+        response = self.client.patch(f"/api/v1/edit-patient/{self.patient.id}/", {"diagnosis": "C61"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_conclusion(), ABNORMAL_CONCLUSION)
+
+        response = self.client.put(f"/api/v1/change-refs/{self.test.id}/", {"cd3_il2_max": 14}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_conclusion(), ABNORMAL_CONCLUSION)
+
+    def test_manual_conclusion_forces_full_pass(self):
+        response = self.client.put(f"/api/v1/conclusion/{self.test.id}/",
+                                   {"conclusion": "вручную", "recommendations": "вручную"}, format="json")
+
+        self.assertEqual(response.data["updated"], 1)
+        self.assertTrue(CohortRefs.objects.get(diagnosis="C50", test_name="cytokine_status").needs_full_pass)
+
+        self.client.put(f"/api/v1/change-refs/{self.test.id}/", {"cd3_il2_min": 5}, format="json")
+
+        self.assertEqual(self.get_conclusion(), NORMAL_CONCLUSION)
+        self.assertFalse(CohortRefs.objects.get(diagnosis="C50", test_name="cytokine_status").needs_full_pass)
+
+    def test_results_by_refs_update_changed_tests_in_one_query(self):
+        normal_test = Test.objects.get(patient_test_id=create_patient_test(self.patient, self.doctor),
+                                       name="cytokine_status")
+        Test.objects.filter(id=self.test.id).update(conclusion=None)
+        Test.objects.filter(id=normal_test.id).update(conclusion=ABNORMAL_CONCLUSION)
+
+        with self.assertNumQueries(2):
+            changed = make_results_by_refs([self.test.id, normal_test.id], "cytokine_status",
+                                           np.array([10.0] * 3), np.array([20.0] * 3))
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(self.get_conclusion(), NORMAL_CONCLUSION)
+        self.assertEqual(self.get_conclusion(normal_test), NORMAL_CONCLUSION)
+        self.assertEqual(make_results_by_refs([self.test.id, normal_test.id], "cytokine_status",
+                                              np.array([10.0] * 3), np.array([14.0] * 3)), 2)
+        self.assertEqual(make_results_by_refs([self.test.id, normal_test.id], "cytokine_status",
+                                              np.array([10.0] * 3), np.array([14.0] * 3)), 0)
+        self.assertEqual(self.get_conclusion(), ABNORMAL_CONCLUSION)
+
+    def test_refs_saved_before_job_scans_tests(self):
+        job = create_refs_change_job(self.test, self.doctor, {"cd3_il2_max": 14})
+        resolve_refs_change_job(job, "cytokine_status")
+
+        self.assertEqual(CohortRefs.objects.get(diagnosis="C50", test_name="cytokine_status").max_refs,
+                         [14, 20, 20])
+        created_test = Test.objects.get(patient_test_id=create_patient_test(self.patient, self.doctor),
+                                        name="cytokine_status")
+        self.assertEqual(self.get_conclusion(created_test), ABNORMAL_CONCLUSION)
+
+        process_refs_change_job(job.id)
+
+        self.assertEqual(RefsChangeJob.objects.get(id=job.id).status, "ready")
+        self.assertEqual(self.get_conclusion(), ABNORMAL_CONCLUSION)
+
+
+    @mock.patch("oncology.services.result_service.CHANGE_REFS_CHUNK_SIZE", 1)
+    def test_job_resumes_after_stale_claim(self):
+        tests = [self.test] + [Test.objects.get(patient_test_id=create_patient_test(self.patient, self.doctor),
+                                                name="cytokine_status") for _ in range(2)]
+        job = create_refs_change_job(self.test, self.doctor, {"cd3_il2_max": 14})
+        resolve_refs_change_job(job, "cytokine_status")
+        make_results_by_refs([tests[0].id], "cytokine_status", np.array(job.resolved_refs["min_refs"]),
+                             np.array(job.resolved_refs["max_refs"]))
+        RefsChangeJob.objects.filter(id=job.id).update(status="processing", processed=1, last_test_id=tests[0].id,
+                                                       updated_at=timezone.now())
+
+        process_refs_change_job(job.id)
+
+        self.assertEqual(RefsChangeJob.objects.get(id=job.id).processed, 1)
+
+        stale_at = timezone.now() - timedelta(seconds=settings.CHANGE_REFS_CLAIM_TIMEOUT + 1)
+        RefsChangeJob.objects.filter(id=job.id).update(updated_at=stale_at)
+        with mock.patch("oncology.services.refs_job_service.make_results_by_refs",
+                        wraps=make_results_by_refs) as results_by_refs:
+            process_refs_change_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.total), ("ready", 3, 3))
+        self.assertEqual([call.args[0] for call in results_by_refs.call_args_list], [[tests[1].id], [tests[2].id]])
+        self.assertEqual([self.get_conclusion(test) for test in tests], [ABNORMAL_CONCLUSION] * 3)
+
+
+class ConclusionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_indicators()
+        cls.doctor = create_doctor()
+        patient = create_patient()
+        cls.patient_tests = [create_patient_test(patient, cls.doctor) for _ in range(2)]
+        cls.hematological_only = create_patient_test(create_patient("Сидоров"), cls.doctor, ["hematological_research"])
+        cls.other_cohort = create_patient_test(create_patient("Козлов", diagnosis="C61"), cls.doctor)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def put_conclusion(self, patient_test, test_name):
+        test = Test.objects.get(patient_test_id=patient_test, name=test_name)
+        return self.client.put(f"/api/v1/conclusion/{test.id}/",
+                               {"conclusion": "вручную", "recommendations": "вручную"}, format="json")
+
+    def get_updated_patient_tests(self, test_name):
+        return set(Test.objects.filter(name=test_name, conclusion="вручную").values_list("patient_test_id", flat=True))
+
+    def test_hematological_conclusion_skips_patient_tests_without_immune_status(self):
+        response = self.put_conclusion(self.patient_tests[0], "hematological_research")
+
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(self.get_updated_patient_tests("hematological_research"),
+                         {patient_test.id for patient_test in self.patient_tests})
+
+    def test_cytokine_conclusion_updates_cohort(self):
+        response = self.put_conclusion(self.patient_tests[0], "cytokine_status")
+
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(self.get_updated_patient_tests("cytokine_status"),
+                         {patient_test.id for patient_test in self.patient_tests})
+
+    def test_matching_conclusions_are_not_rewritten(self):
+        Test.objects.filter(patient_test_id=self.patient_tests[1], name="cytokine_status") \
+            .update(conclusion="вручную", recommendations="вручную")
+
+        self.assertEqual(self.put_conclusion(self.patient_tests[0], "cytokine_status").data["updated"], 1)
+        self.assertEqual(self.put_conclusion(self.patient_tests[0], "cytokine_status").data["updated"], 0)
+
+
+class CohortStatsTests(TestCase):
+    def setUp(self):
+        reset_cohort_stats()
+        create_indicators()
+        self.patient = create_patient()
+        self.patient_test = create_patient_test(self.patient, create_doctor(), ["cytokine_status"])
+
+    def get_indicator_stats(self, diagnosis="C50"):
+        return {stats["name"]: stats for stats in get_cohort_stats(diagnosis)["indicators"]}
+
+    def test_stats_match_all_values(self):
+        values = [12, 8, 44.5, 18, 27, 55, 33, 30.25]
+        test = Test.objects.get(patient_test_id=self.patient_test, name="cytokine_status")
+        indicator = Indicator.objects.get(name="cd3_il2_stimulated")
+        Analysis.objects.bulk_create([Analysis(value=value, indicator_id=indicator, test_id=test) for value in values])
+        values = np.array(values + [30], dtype=float)
+
+        stats = self.get_indicator_stats()["cd3_il2_stimulated"]
+
+        self.assertEqual(stats["count"], values.size)
+        self.assertAlmostEqual(stats["mean"], values.mean(), places=4)
+        self.assertEqual((stats["min_value"], stats["max_value"]), (8, 55))
+        for percentile, value in zip((5, 25, 50, 75, 95), np.percentile(values, (5, 25, 50, 75, 95))):
+            self.assertAlmostEqual(stats["percentiles"][f"p{percentile}"], value, places=4)
+        self.assertAlmostEqual(stats["outside_refs_share"], 2 / values.size, places=4)
+
+    def test_outside_refs_share_is_null_without_refs(self):
+        Indicator.objects.filter(name="cd3_il2_spontaneous").update(interval_min=None, interval_max=None)
+        reset_indicators_registry()
+
+        stats = self.get_indicator_stats()
+
+        self.assertIsNone(stats["cd3_il2_spontaneous"]["outside_refs_share"])
+        self.assertEqual(stats["cd3_il2_stimulated"]["outside_refs_share"], 0)
+
+    def test_patient_diagnosis_change_resets_stats(self):
+        self.assertEqual(self.get_indicator_stats()["cd3_il2_stimulated"]["count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.diagnosis = "C61"
+            self.patient.save()
+
+        self.assertEqual(get_cohort_stats("C50"), {"indicators": [], "ratios": []})
+        self.assertEqual(self.get_indicator_stats("C61")["cd3_il2_stimulated"]["count"], 1)
+
+
+class IndicatorAggregateTests(TestCase):
+    def setUp(self):
+        create_indicators()
+        self.doctor = create_doctor()
+        self.patient = create_patient()
+        self.patient_tests = [create_patient_test(self.patient, self.doctor) for _ in range(2)]
+
+    def get_aggregates(self):
+        return sorted(IndicatorAggregate.objects.values_list("patient_id", "indicator_id__name", "count", "mean",
+                                                             "min", "max", "last_value", "last_date"))
+
+    def assertAggregatesMatchRecompute(self):
+        aggregates = self.get_aggregates()
+        rebuild_indicator_aggregates()
+        self.assertEqual(aggregates, self.get_aggregates())
+
+    def test_aggregates_match_recompute_after_create_edit_and_delete(self):
+        self.assertEqual(IndicatorAggregate.objects.get(indicator_id__name="lymphocytes").count, 2)
+        self.assertAggregatesMatchRecompute()
+
+        with override_settings(GRAPHIC_RENDERING="off"):
+            update_tests_and_analysises(self.patient_tests[0].id, self.doctor, timezone.now(), "2024-03-25",
+                                        [{"name": "hematological_research",
+                                          "analysis": [{"indicator_name": "lymphocytes", "value": 2.5}]}])
+        self.assertEqual(IndicatorAggregate.objects.get(indicator_id__name="lymphocytes").last_value, 2.5)
+        self.assertAggregatesMatchRecompute()
+
+        Analysis.objects.filter(test_id__patient_test_id=self.patient_tests[1], test_id__name="cytokine_status",
+                                indicator_id__name="cd3_il2_stimulated").get().delete()
+        self.assertEqual(IndicatorAggregate.objects.get(indicator_id__name="cd3_il2_stimulated").count, 1)
+        self.assertAggregatesMatchRecompute()
+
+
+class PatientTestsCreateTests(TestCase):
+    def test_unknown_indicator_creates_nothing(self):
+        create_indicators()
+        patient = create_patient()
+        tests = [{"name": name, "analysis": [{"indicator_name": indicator_name, "value": value}
+                                             for indicator_name, (_, _, value) in INDICATORS[name].items()]}
+                 for name in INDICATORS]
+        tests[-1]["analysis"].append({"indicator_name": "unknown", "value": 1})
+
+        with self.assertRaises(NotFound):
+            create_tests_and_analysises(patient.id, create_doctor(), timezone.now(), timezone.now(), "2024-03-24",
+                                        tests)
+
+        self.assertFalse(PatientTests.objects.exists())
+        self.assertFalse(Test.objects.exists())
+        self.assertFalse(Analysis.objects.exists())
+
+
+@override_settings(GRAPHIC_RENDERING="off")
+class PatientTestsEditTests(TestCase):
+    @mock.patch("oncology.services.patient_test_service.get_cytokine_analysis_and_make_result")
+    @mock.patch("oncology.services.patient_test_service.get_hematological_and_immune_analysis_and_make_result")
+    @mock.patch("oncology.services.patient_test_service.get_regeneration_analysis_and_make_result")
+    def test_edit_recomputes_each_changed_panel_once(self, regeneration_result, hematological_and_immune_result,
+                                                     cytokine_result):
+        create_indicators()
+        doctor = create_doctor()
+        patient_test = create_patient_test(create_patient(), doctor)
+        for result in (regeneration_result, hematological_and_immune_result, cytokine_result):
+            result.reset_mock()
+
+        update_tests_and_analysises(patient_test.id, doctor, timezone.now(), "2024-03-24", [
+            {"name": "hematological_research", "analysis": [{"indicator_name": "lymphocytes", "value": 2.5},
+                                                            {"indicator_name": "neutrophils", "value": 4.5}]},
+            {"name": "immune_status", "analysis": [{"indicator_name": "t_helpers", "value": 1.0}]},
+            {"name": "cytokine_status", "analysis": [{"indicator_name": "cd3_il2_stimulated", "value": 30}]},
+        ])
+
+        self.assertEqual(regeneration_result.call_count, 1)
+        self.assertEqual(hematological_and_immune_result.call_count, 1)
+        cytokine_result.assert_not_called()
+
+
+@override_settings(GRAPHIC_RENDERING="off")
+class TestRatioTests(TestCase):
+    def test_ratios_are_upserted_on_edit(self):
+        create_indicators()
+        doctor = create_doctor()
+        patient_test = create_patient_test(create_patient(), doctor, ["cytokine_status"])
+        ratios = TestRatio.objects.filter(test_id__patient_test_id=patient_test)
+        ratio_ids = dict(ratios.values_list("name", "id"))
+        self.assertEqual(dict(ratios.values_list("name", "value")), {"cd3_il2": 15, "cd3_tnfa": 15, "cd3_ifny": 15})
+
+        update_tests_and_analysises(patient_test.id, doctor, timezone.now(), "2024-03-24", [
+            {"name": "cytokine_status", "analysis": [{"indicator_name": "cd3_il2_stimulated", "value": 40}]}])
+
+        self.assertEqual(dict(ratios.values_list("name", "value")), {"cd3_il2": 20, "cd3_tnfa": 15, "cd3_ifny": 15})
+        self.assertEqual(dict(ratios.values_list("name", "id")), ratio_ids)
+
+
+class AnalysisComparisonTests(TestCase):
+    def setUp(self):
+        create_indicators()
+        doctor = create_doctor()
+        patient = create_patient()
+        analysis_dates = [date(2023, 6, 1), date(2023, 11, 15), date(2024, 1, 10), date(2024, 3, 24)]
+        self.patient_tests = [create_patient_test(patient, doctor) for _ in analysis_dates]
+        for i, (patient_test, analysis_date) in enumerate(zip(self.patient_tests, analysis_dates)):
+            PatientTests.objects.filter(id=patient_test.id).update(analysis_date=analysis_date)
+            for analysis in Analysis.objects.filter(test_id__patient_test_id=patient_test):
+                Analysis.objects.filter(id=analysis.id).update(value=analysis.value * (i + 1) + analysis.id % 3)
+
+    def get_comparison_by_indicator(self, test, months):
+        patient_test = PatientTests.objects.get(id=test.patient_test_id_id)
+        analysises_prev = Analysis.objects.filter(
+            test_id__patient_test_id__patient_id=patient_test.patient_id_id,
+            test_id__patient_test_id__analysis_date__lt=patient_test.analysis_date,
+            test_id__patient_test_id__analysis_date__gte=patient_test.analysis_date - relativedelta(months=months),
+        ).exclude(test_id__name="regeneration_type")
+
+        comparison = []
+        for analysis in Analysis.objects.filter(test_id__patient_test_id=patient_test) \
+                .exclude(test_id__name="regeneration_type").select_related("indicator_id").order_by("id"):
+            avg = analysises_prev.filter(indicator_id=analysis.indicator_id).aggregate(Avg("value"))["value__avg"]
+            changes = round((analysis.value - avg) / avg * 100, 2) if avg else None
+            comparison.append((get_indicator_label(analysis.indicator_id.name), analysis.value,
+                               round(avg, 2) if avg else None, changes))
+        return comparison
+
+    def test_grouped_comparison_matches_per_indicator_averages(self):
+        for patient_test in self.patient_tests:
+            test = Test.objects.select_related("patient_test_id").get(patient_test_id=patient_test,
+                                                                      name="cytokine_status")
+            for months in (1, 6, 12):
+                comparison = [(row["name"], row["value"], row["avg_prev_value"], row["changes"])
+                              for row in get_analysis_comparison(test, months)["analysis"]]
+                self.assertEqual(comparison, self.get_comparison_by_indicator(test, months))
+
+
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        create_indicators()
+        doctor = create_doctor()
+        self.patient = create_patient()
+        analysis_dates = [date(2024, 1, 10), date(2024, 1, 25), date(2024, 3, 5), date(2024, 5, 2), date(2025, 2, 1)]
+        for value, analysis_date in enumerate(analysis_dates, 1):
+            patient_test = create_patient_test(self.patient, doctor)
+            PatientTests.objects.filter(id=patient_test.id).update(analysis_date=analysis_date)
+            Analysis.objects.filter(test_id__patient_test_id=patient_test, indicator_id__name="lymphocytes") \
+                .update(value=value)
+
+    def get_points(self, bucket, date_from=None, date_to=None):
+        series, = get_indicators_time_series(self.patient.id, ["lymphocytes"], bucket, date_from, date_to)
+        return [(point["date"], point["count"], point["min_value"], point["max_value"], point["avg_value"])
+                for point in series["points"]]
+
+    def test_points_are_bucketed_by_period_start(self):
+        self.assertEqual(self.get_points("month"), [(date(2024, 1, 1), 2, 1, 2, 1.5), (date(2024, 3, 1), 1, 3, 3, 3),
+                                                    (date(2024, 5, 1), 1, 4, 4, 4), (date(2025, 2, 1), 1, 5, 5, 5)])
+        self.assertEqual(self.get_points("quarter"), [(date(2024, 1, 1), 3, 1, 3, 2), (date(2024, 4, 1), 1, 4, 4, 4),
+                                                      (date(2025, 1, 1), 1, 5, 5, 5)])
+        self.assertEqual(self.get_points("year"), [(date(2024, 1, 1), 4, 1, 4, 2.5), (date(2025, 1, 1), 1, 5, 5, 5)])
+        self.assertEqual(self.get_points("quarter", date(2024, 1, 20), date(2024, 12, 31)),
+                         [(date(2024, 1, 1), 2, 2, 3, 2.5), (date(2024, 4, 1), 1, 4, 4, 4)])
+
+        series, = get_ratios_time_series(self.patient.id, ["cd3_il2"], "year")
+        self.assertEqual([(point["date"], point["count"], point["avg_value"]) for point in series["points"]],
+                         [(date(2024, 1, 1), 4, 15), (date(2025, 1, 1), 1, 15)])
+
+    def test_points_without_bucket_are_listed_by_date(self):
+        series, = get_indicators_time_series(self.patient.id, ["lymphocytes"], date_to=date(2024, 3, 31))
+
+        self.assertEqual([(point["date"], point["value"]) for point in series["points"]],
+                         [(date(2024, 1, 10), 1), (date(2024, 1, 25), 2), (date(2024, 3, 5), 3)])
@@ -24,14 +24,20 @@ urlpatterns = [
     path("patients-info/", views.PatientInfoView.as_view()),
 
     path("graphic/<int:pk>/", views.GraphicView.as_view()),
+    path("graphic-data/<int:pk>/", views.GraphicDataView.as_view()),
 
     path("test-patient/<int:pk>/", views.TestsPatientView.as_view()),
 
     path("analysis-comparison/<int:pk>/", views.AnalysisComparisonView.as_view()),
     path("patient-analysis/<int:pk>/", views.PatientAnalysisView.as_view()),
+    path("patient-time-series/<int:pk>/", views.PatientTimeSeriesView.as_view()),
 
     path("search-patient/", views.SearchPatientView.as_view()),
+    path("patient-autocomplete/", views.PatientAutocompleteView.as_view()),
 
     path("conclusion/<int:pk>/", views.ConclusionView.as_view()),
     path("change-refs/<int:pk>/", views.ChangeRefsView.as_view()),
+    path("change-refs-job/<int:pk>/", views.RefsChangeJobView.as_view()),
+    path("ratio-outliers/", views.RatioOutliersView.as_view()),
+    path("cohort-stats/", views.CohortStatsView.as_view()),
 ]
@@ -4,24 +4,36 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from .serializers import DoctorSignupSerializer, BaseDoctorSerializer, DoctorLoginSerializer
 from rest_framework.response import Response
-from .models import Doctor, SubjectInfo, CopyrightInfo, Patient, Indicator, Test, PatientTests
+from rest_framework import status
+from .models import Doctor, SubjectInfo, CopyrightInfo, Patient, Indicator, Test, PatientTests, RefsChangeJob
 from .serializers import SubjectInfoSerializer, CopyrightInfoSerializer, PatientSerializer, SubjectListSerializer,\
     IndicatorSerializer, GraphicSerializer, PatientInfoSerializer, TestNameSerializer, SearchPatientSerializer,\
-    ConclusionSerializer, ChangeRefsSerializer, PatientOperationSerializer
+    ConclusionSerializer, ChangeRefsSerializer, PatientOperationSerializer, RatioOutliersSerializer,\
+    AnalysisComparisonSerializer, TimeSeriesSerializer, CohortStatsSerializer, PatientAutocompleteSerializer,\
+    TestsPatientSerializer
 from datetime import datetime
+from django.conf import settings
+from django.db import transaction
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from oncology.services.test_service import get_tests_all_types, get_test_info_for_graphic
+from oncology.services.test_service import get_tests_all_types
 from oncology.services.patient_test_service import create_tests_and_analysises, update_tests_and_analysises,\
-    draw_graphics_and_make_results, get_patient_tests_by_id
+    make_results_and_enqueue_graphics
+from oncology.services.indicator_service import get_indicator_label
 from oncology.services.doctor_service import set_doctor_password, get_doctor_by_email
 from oncology.services.auth_service import create_token, get_or_create_token
 from oncology.services.copyright_service import get_copyright_info
-from oncology.services.patient_service import get_tests_for_patient, search_patients
-from oncology.services.analysis_service import get_analysises_by_test_id, get_analysis_comparison,\
-    get_analysises_and_analysis_prev_by_test_id
-from oncology.services.result_service import save_conclusion_and_recommendations, change_refs
-from oncology.services.graphic_service import get_graphics_by_patient_test_id
+from oncology.services.patient_service import get_tests_for_patient, search_patients, autocomplete_patients
+from oncology.services.analysis_service import get_analysises_by_test_id, get_analysis_comparison
+from oncology.services.result_service import save_conclusion_and_recommendations, change_refs, \
+    make_patient_results_by_cohort_refs
+from oncology.services.graphic_service import get_graphics_by_patient_test_id, get_charts, get_chart_data
+from oncology.services.graphic_job_service import render_graphics_on_demand, submit_graphics, is_claimable
+from oncology.services.refs_job_service import create_refs_change_job, get_refs_change_job_progress
+from oncology.services.ratio_service import get_ratio_outliers
+from oncology.services.time_series_service import get_indicators_time_series, get_ratios_time_series
+from oncology.services.cohort_stats_service import get_cohort_stats
+from .pagination import PatientCursorPagination
 
 
 class DoctorSignupView(GenericAPIView):
@@ -168,18 +180,50 @@ class PatientCreationView(CreateAPIView):
 
 class PatientEditView(RetrieveUpdateDestroyAPIView):
     """
-    Редактирование данных о пациенте
+    Редактирование данных о пациенте. При смене диагноза заключения тестов пациента пересчитываются
+    по реф. значениям новой когорты
     """
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_update(self, serializer):
+        diagnosis = serializer.instance.diagnosis
+        with transaction.atomic():
+            patient = serializer.save()
+            if patient.diagnosis != diagnosis:
+                make_patient_results_by_cohort_refs(patient)
+
 
 class PatientInfoView(ListAPIView):
-    queryset = Patient.objects.all()
+    """
+    Эндпоинт для вывода списка пациентов, отсортированного по фамилии, постранично. Параметры запроса:
+    cursor - курсор страницы (из next/previous), page_size - число пациентов на странице,
+    fields - выводимые поля через запятую (например fields=id,last_name). Вывод в виде:
+    {
+    "next": "http://.../patients-info/?cursor=eyJsYXN0X25hbWUiOi...",
+    "previous": null,
+    "results": [
+        {
+            "id": 1,
+            "first_name": "Иван",
+            "last_name": "Петров",
+            "patronymic": "Сергеевич",
+            "birth_date": "1970-01-01"
+        }
+    ]
+    }
+    """
     serializer_class = PatientInfoSerializer
+    pagination_class = PatientCursorPagination
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        fields = set(PatientInfoSerializer.Meta.fields)
+        if self.request.query_params.get("fields"):
+            fields &= set(self.request.query_params["fields"].split(","))
+        return Patient.objects.only("id", "last_name", *fields)
+
 
 class IndicatorView(CreateAPIView):
     queryset = Indicator.objects.all()
@@ -189,10 +233,13 @@ class IndicatorView(CreateAPIView):
 
 class TestsPatientView(APIView):
     """
-    Эндпоинт для вывода информации об анализах пациента, где id - id пациента, вывод в виде:
+    Эндпоинт для вывода информации об анализах пациента, где id - id пациента. Анализы выводятся по возрастанию даты.
+    Параметры запроса: date_from и date_to - границы дат анализов, limit - число последних анализов.
+    Вывод в виде:
         {
         "patient_tests": [
             {
+                "id": 1,
                 "analysis_date": "2024-03-24",
                 "tests":[
                    {
@@ -212,29 +259,13 @@ class TestsPatientView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        patient = get_tests_for_patient(pk)
-
-        data = {
-            "patient_tests": []
-        }
-
-        for patient_test in patient.patienttests_set.all():
-            patient_test_data = {
-                "id": patient_test.id,
-                "analysis_date": patient_test.analysis_date,
-                "tests": []
-            }
-
-            for test in patient_test.test_set.all():
-                if test.name != "regeneration_type":
-                    patient_test_data["tests"].append({
-                        "id": test.pk,
-                        "name": test.name
-                    })
-
-            data["patient_tests"].append(patient_test_data)
+        serializer = TestsPatientSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
-        return Response(data)
+        return Response({
+            "patient_tests": get_tests_for_patient(pk, data["date_from"], data["date_to"], data["limit"])
+        })
 
 
 class PatientTestsView(APIView):
@@ -285,8 +316,8 @@ class PatientTestsView(APIView):
         hematological_research_tests, immune_status_tests, cytokine_status_tests, regeneration_type_tests\
             = get_tests_all_types(patient_test)
 
-        draw_graphics_and_make_results(patient_test, regeneration_type_tests, hematological_research_tests,
-                                       immune_status_tests, cytokine_status_tests)
+        make_results_and_enqueue_graphics(patient_test, regeneration_type_tests, hematological_research_tests,
+                                          immune_status_tests, cytokine_status_tests)
 
         return Response(f"Анализ с id {patient_test.id} создан")
 
@@ -353,24 +384,23 @@ class PatientAnalysisView(RetrieveAPIView):
     ]
     """
     serializer_class = TestNameSerializer
-    queryset = Test.objects.all()
+    queryset = Test.objects.select_related("patient_test_id")
     permission_classes = [IsAuthenticated]
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
         data = serializer.data
-        patient_test = get_patient_tests_by_id(instance.patient_test_id.id)
-        data["analysis_date"] = patient_test.analysis_date
+        data["analysis_date"] = instance.patient_test_id.analysis_date
         analysises = get_analysises_by_test_id(instance)
         data["analysis"] = []
         for analysis in analysises:
             analysis_data = {
-                "name": get_names_dict()[analysis.indicator_id.name],
-                "value": analysis.value,
-                "interval_min": analysis.indicator_id.interval_min,
-                "interval_max": analysis.indicator_id.interval_max,
-                "unit": analysis.indicator_id.unit
+                "name": get_indicator_label(analysis["indicator_id__name"]),
+                "value": analysis["value"],
+                "interval_min": analysis["indicator_id__interval_min"],
+                "interval_max": analysis["indicator_id__interval_max"],
+                "unit": analysis["indicator_id__unit"]
             }
             data["analysis"].append(analysis_data)
 
@@ -379,7 +409,11 @@ class PatientAnalysisView(RetrieveAPIView):
 
 class ConclusionView(RetrieveUpdateAPIView):
     """
-    Эндпоинт для вывода/редактирования заключения и рекомендаций теста. В ссылке передается id теста
+    Эндпоинт для вывода/редактирования заключения и рекомендаций теста. В ссылке передается id теста.
+    Заключение записывается во все тесты этого типа у пациентов с тем же диагнозом (для hematological_research
+    и immune_status - только в анализах, где есть обе панели), тесты с таким же заключением и рекомендациями
+    не перезаписываются. В ответе updated - число изменённых тестов. Следующее изменение реф. значений этого
+    типа пересчитает все тесты когорты
     """
     queryset = Test.objects.all()
     serializer_class = ConclusionSerializer
@@ -392,7 +426,7 @@ class ConclusionView(RetrieveUpdateAPIView):
         type_name = instance.name
         request_data = request.data
         serializer_data = serializer.data
-        save_conclusion_and_recommendations(instance, type_name, request_data)
+        serializer_data["updated"] = save_conclusion_and_recommendations(instance, type_name, request_data)
         return Response(serializer_data)
 
 
@@ -439,6 +473,9 @@ class ChangeRefsView(RetrieveUpdateAPIView):
         "neu_lymf_max": 1,
         "neu_mon_max": 1
     }
+    Не переданные границы остаются такими, какие сохранены для диагноза пациента (или стандартными).
+    При CHANGE_REFS_BACKGROUND=True изменение выполняется в фоне, ответ (202): {"job_id": 1, "status": "pending"},
+    ход выполнения отдаёт /change-refs-job/<job_id>/
     """
     queryset = Test.objects.all()
     serializer_class = ChangeRefsSerializer
@@ -451,14 +488,94 @@ class ChangeRefsView(RetrieveUpdateAPIView):
         type_name = instance.name
         request_data = request.data
 
+        if settings.CHANGE_REFS_BACKGROUND:
+            job = create_refs_change_job(instance, request.user, request_data)
+            return Response({"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED)
+
         change_refs(instance, type_name, request_data)
 
         return Response("Реф. значения изменены")
 
 
+class RefsChangeJobView(RetrieveAPIView):
+    """
+    Эндпоинт для вывода хода фонового изменения реф.значений, в url передается job_id. Вывод в виде:
+    {
+        "id": 1,
+        "status": "processing",
+        "processed": 2000,
+        "total": 5400,
+        "charts_pending": 3
+    }
+    status - pending, processing, ready или failed; processed/total - число пересчитанных тестов и их общее число,
+    charts_pending - число анализов этой группы пациентов, графики которых ещё строятся
+    """
+    queryset = RefsChangeJob.objects.select_related("test_id")
+    permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_refs_change_job_progress(self.get_object()))
+
+
+class RatioOutliersView(GenericAPIView):
+    """
+    Эндпоинт для вывода тестов, у которых соотношение выходит за границы. Параметры запроса:
+    test_name - тип теста, name - соотношение (например cd19_cd4), min и/или max - границы,
+    patients=true - сгруппировать по пациентам, limit - число записей (по умолчанию 100).
+    Вывод в виде:
+    [
+        {
+            "test_id": 4,
+            "patient_test_id": 1,
+            "patient_id": 1,
+            "analysis_date": "2024-03-24",
+            "value": 0.52
+        }
+    ]
+    При patients=true:
+    [
+        {
+            "patient_id": 1,
+            "first_name": "Иван",
+            "last_name": "Петров",
+            "patronymic": "Сергеевич",
+            "tests_count": 2,
+            "min_value": 0.52,
+            "max_value": 0.61
+        }
+    ]
+    """
+    serializer_class = RatioOutliersSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        ratios = get_ratio_outliers(data["test_name"], data["name"], data.get("min"), data.get("max"),
+                                    data["patients"], data["limit"])
+        if data["patients"]:
+            return Response([{"patient_id": ratio["test_id__patient_test_id__patient_id"],
+                              "first_name": ratio["test_id__patient_test_id__patient_id__first_name"],
+                              "last_name": ratio["test_id__patient_test_id__patient_id__last_name"],
+                              "patronymic": ratio["test_id__patient_test_id__patient_id__patronymic"],
+                              "tests_count": ratio["tests_count"],
+                              "min_value": ratio["min_value"],
+                              "max_value": ratio["max_value"]} for ratio in ratios])
+
+        return Response([{"test_id": ratio["test_id"],
+                          "patient_test_id": ratio["test_id__patient_test_id"],
+                          "patient_id": ratio["test_id__patient_test_id__patient_id"],
+                          "analysis_date": ratio["test_id__patient_test_id__analysis_date"],
+                          "value": ratio["value"]} for ratio in ratios])
+
+
 class AnalysisComparisonView(RetrieveAPIView):
     """
-    Эндпоинт для вывода сравнений анализов (печатная форма), в ссылке передается id у Test
+    Эндпоинт для вывода сравнений анализов (печатная форма), в ссылке передается id у Test.
+    avg_prev_value - среднее значение показателя за months месяцев до даты анализа
+    (параметр запроса months, по умолчанию 6).
     Вывод в виде:{
     "analysis": [
         {
@@ -468,26 +585,128 @@ class AnalysisComparisonView(RetrieveAPIView):
             "interval_min": 0.33,
             "interval_max": 0.65,
             "unit": "10E9/л",
-            "changes": null
+            "changes": null,
+            "history": {
+                "count": 12,
+                "avg_value": 131.5,
+                "min_value": 98.0,
+                "max_value": 160.0,
+                "last_value": 140.0,
+                "last_date": "2024-03-24"
+            }
         },
     ]
+    history - сводка по всем анализам пациента (число, среднее, минимум, максимум, последнее значение и его дата)
     """
-    queryset = Test.objects.all()
+    queryset = Test.objects.select_related("patient_test_id")
+    serializer_class = AnalysisComparisonSerializer
     permission_classes = [IsAuthenticated]
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        data = request.data
-
-        patient_test = get_patient_tests_by_id(instance.patient_test_id.id)
-        patient_test_date = patient_test.analysis_date
-        analysises_prev, analysises = get_analysises_and_analysis_prev_by_test_id(instance, patient_test_date)
-        data["analysis"] = []
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
 
-        data = get_analysis_comparison(data, analysises_prev, analysises, get_names_dict())
+        data = get_analysis_comparison(instance, serializer.validated_data["months"])
         return Response(data)
 
 
+class PatientTimeSeriesView(RetrieveAPIView):
+    """
+    Эндпоинт для вывода динамики показателей и соотношений пациента, в ссылке передается id у Patient.
+    Параметры запроса: indicators - показатели (можно несколько, например indicators=leukocytes&indicators=igA),
+    ratios - соотношения (например ratios=neu_lymf), bucket - группировка по периодам (month, quarter, year),
+    date_from и date_to - границы дат анализов.
+    Вывод в виде:
+    {
+    "indicators": [
+        {
+            "name": "leukocytes",
+            "label": "лейкоциты",
+            "points": [
+                {
+                    "date": "2024-03-24",
+                    "value": 5.0,
+                    "patient_test_id": 1
+                }
+            ]
+        }
+    ],
+    "ratios": [
+        {
+            "test_name": "hematological_research",
+            "name": "neu_lymf",
+            "points": [...]
+        }
+    ]
+    }
+    При указании bucket точка содержит date (начало периода), count, min_value, max_value, avg_value.
+    """
+    queryset = Patient.objects.all()
+    serializer_class = TimeSeriesSerializer
+    permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        indicators = get_indicators_time_series(instance.id, data["indicators"], data["bucket"],
+                                                data["date_from"], data["date_to"]) if data["indicators"] else []
+        ratios = get_ratios_time_series(instance.id, data["ratios"], data["bucket"],
+                                        data["date_from"], data["date_to"]) if data["ratios"] else []
+        for indicator in indicators:
+            indicator["label"] = get_indicator_label(indicator["name"])
+        return Response({"indicators": indicators, "ratios": ratios})
+
+
+class CohortStatsView(GenericAPIView):
+    """
+    Эндпоинт для вывода статистики по когорте пациентов. Параметры запроса: diagnosis и/или region,
+    date_from и date_to - границы дат анализов.
+    Вывод в виде:
+    {
+    "indicators": [
+        {
+            "name": "leukocytes",
+            "label": "лейкоциты",
+            "count": 120,
+            "mean": 6.41,
+            "min_value": 2.1,
+            "max_value": 14.3,
+            "percentiles": {"p5": 3.2, "p25": 4.9, "p50": 6.2, "p75": 7.8, "p95": 10.4},
+            "outside_refs_share": 0.12
+        }
+    ],
+    "ratios": [
+        {
+            "test_name": "hematological_research",
+            "name": "neu_lymf",
+            "count": 120,
+            ...
+        }
+    ]
+    }
+    outside_refs_share - доля значений вне референсных значений, null если референсные значения не заданы
+    """
+    serializer_class = CohortStatsSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        stats = get_cohort_stats(data["diagnosis"], data["region"], data["date_from"], data["date_to"])
+        return Response({
+            "indicators": [{"name": indicator["name"],
+                            "label": get_indicator_label(indicator["name"]),
+                            **indicator} for indicator in stats["indicators"]],
+            "ratios": stats["ratios"],
+        })
+
+
 class OperationInfoView(RetrieveUpdateAPIView):
     """
     Эндпоинт для вывода/редактирования информации с операцией. В заголовке передается id пациента
@@ -498,6 +717,10 @@ class OperationInfoView(RetrieveUpdateAPIView):
 
 
 class SearchPatientView(GenericAPIView):
+    """
+    Эндпоинт для поиска пациентов по началу фамилии, имени и отчества (без учёта регистра, е и ё не различаются)
+    и дате рождения. Сначала выводятся точные совпадения, число результатов ограничено PATIENT_SEARCH_LIMIT
+    """
     serializer_class = SearchPatientSerializer
     permission_classes = [IsAuthenticated]
 
@@ -523,9 +746,54 @@ class SearchPatientView(GenericAPIView):
         return Response(data)
 
 
+class PatientAutocompleteView(GenericAPIView):
+    """
+    Эндпоинт для подсказок при вводе ФИО пациента. Параметры запроса: q - строка в порядке
+    "фамилия имя отчество" (каждое слово - начало соответствующей части), limit - число подсказок (по умолчанию 10).
+    Вывод в виде:
+    [
+        {
+            "id": 1,
+            "full_name": "Петров Иван Сергеевич",
+            "birth_date": "1970-01-01"
+        }
+    ]
+    """
+    serializer_class = PatientAutocompleteSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        patients = autocomplete_patients(data["q"], data["limit"])
+        return Response([{"id": patient["id"],
+                          "full_name": " ".join((patient["last_name"], patient["first_name"], patient["patronymic"])),
+                          "birth_date": patient["birth_date"]} for patient in patients])
+
+
 class GraphicView(RetrieveAPIView):
     """
-    Эндпоинт для вывода ссылок графиков, в url передается id PatientTest
+    Эндпоинт для вывода ссылок графиков, в url передается id PatientTest.
+    Графики строятся в фоне после создания/редактирования анализа (GRAPHIC_RENDERING=eager)
+    либо при первом запросе этого эндпоинта (GRAPHIC_RENDERING=lazy). Пока они не готовы,
+    возвращается код 202 и статус построения:
+    {
+        "status": "pending"
+    }
+    status - pending (в очереди), processing (строятся), failed (ошибка построения).
+    Графики, не построенные из-за перезапуска сервера, ставятся в очередь повторно при запросе.
+    Готовые графики выводятся в виде:
+    [
+        {
+            "graphic": "https://.../hematological_research_<hash>.png",
+            "test_name": "hematological_research",
+            "test_id": 1,
+            "conclusion": "значения в пределах нормы",
+            "recommendations": "..."
+        }
+    ]
     """
     serializer_class = GraphicSerializer
     queryset = PatientTests.objects.all()
@@ -533,59 +801,59 @@ class GraphicView(RetrieveAPIView):
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
+        graphic_status = instance.graphic_status
+        if graphic_status in ("pending", "processing") and settings.GRAPHIC_RENDERING == "lazy":
+            graphic_status = render_graphics_on_demand(instance.id)
+        elif settings.GRAPHIC_RENDERING == "eager" and is_claimable(instance):
+            submit_graphics(instance.id)
+        if graphic_status != "ready":
+            return Response({"status": graphic_status}, status=status.HTTP_202_ACCEPTED)
         graphics = get_graphics_by_patient_test_id(instance)
         serializer = self.get_serializer(graphics, many=True)
-        data = serializer.data
-
-        data = get_test_info_for_graphic(instance, data)
-
-        return Response(data)
+        return Response(serializer.data)
 
 
-def get_names_dict():
-    names_dict = {
-        "leukocytes": "лейкоциты",
-        "lymphocytes": "лимфоциты",
-        "monocytes": "моноциты",
-        "neutrophils": "нейтрофилы",
-        "eosinophils": "эозинофилы",
-        "basophils": "базофилы",
-        "hemoglobin": "гемоглобин",
-        "hematocrit": "гематокрит",
-        "platelets": "тромбоциты",
-        "erythrocytes": "эритроциты",
-        "avg_erythrocyte_volume": "ср.объем эритроциты",
-        "avg_hem_cont_in_eryth": "ср.сод.гем. в эритроциты",
-        "avg_hem_conc_in_eryth": "ср.конц.гем в эритроциты",
-        "eryth_volume_distr": "распр.эритр. по объему",
-        "ave_platelet_volume": "ср.объем эритроцита",
-        "thrombocrit": "тромбокрит",
-        "thromb_volume_distr": "распр.тромб. по объему",
-        "b_lymphocytes": "б-лимфоциты",
-        "t_cytotoxic_lymphocytes": "т-цитоксические лимфоциты",
-        "t_lymphocytes": "т-лимфоциты",
-        "t_helpers": "т-хелперы",
-        "nk_cells": "nk-клетки",
-        "tnk": "тнк",
-        "active_t_lymphocytes": "активные т-лимфоциты",
-        "igA": "igA",
-        "igG": "igG",
-        "igM": "igM",
-        "circulating_immune_complexes": "циркулирующие имунные комплексы",
-        "nst_test_spontaneous": "нст-тест (спонтанный)",
-        "nst_test_stimulated": "нст-тест (стимулированный)",
-        "leukotytes_bactericidal_activity": "бактерицидная активность лейкоцитов",
-        "neutrophils_absorption_activity": "поглотительная активность нейтрофилов",
-        "monocytes_absorption_activity": "поглотительная активность моноцитов",
-        "cd3_ifny_stimulated": "cd3+ifny+(стимулированный)",
-        "cd3_ifny_spontaneous": "cd3+ifny+(спонтанный)",
-        "cd3_tnfa_stimulated": "cd3+tnfa+(стимулированный)",
-        "cd3_tnfa_spontaneous": "cd3+tnfa+(спонтанный)",
-        "cd3_il2_stimulated": "cd3+il2+(стимулированный)",
-        "cd3_il2_spontaneous": "cd3+il2+(спонтанный)",
-        "cd3_il4_stimulated": "cd3+il4+(стимулированный)",
-        "cd3_il4_spontaneous": "cd3+il4+(спонтанный)",
-        "cd3_negative_ifny_stimulated": "cd3-ifny+(стимулированный)",
-        "cd3_negative_ifny_spontaneous": "cd3-ifny+(спонтанный)",
+class GraphicDataView(RetrieveAPIView):
+    """
+    Эндпоинт для вывода данных, по которым строятся графики, в url передается id PatientTest.
+    Позволяет клиенту рисовать графики самостоятельно, без PNG. Вывод в виде:
+    {
+        "id": 1,
+        "analysis_date": "2024-03-24",
+        "charts": [
+            {
+                "name": "cytokine_status",
+                "test_id": 4,
+                "labels": ["Интерликин", "ФНО", "Интерферон"],
+                "angles": [5.759, 1.570, 3.665],
+                "scale": [24.0, 24.0, 24.0],
+                "values": [100.0, 90.0, 130.0],
+                "values_scaled": [4.16, 3.75, 5.41],
+                "min_refs": [80, 80, 80],
+                "max_refs": [120, 120, 120],
+                "min_refs_scaled": [3.33, 3.33, 3.33],
+                "max_refs_scaled": [5.0, 5.0, 5.0]
+            }
+        ]
     }
-    return names_dict
+    values - значения соотношений, values_scaled - значения, поделенные на делители шкалы (scale),
+    angles - углы осей в радианах
+    """
+    queryset = PatientTests.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        tests = {test.name: test.id for test in instance.test_set.all()}
+
+        charts = []
+        for graphic_name, values in get_charts(instance).items():
+            chart = get_chart_data(graphic_name, values)
+            chart["test_id"] = tests.get(graphic_name)
+            charts.append(chart)
+
+        return Response({
+            "id": instance.id,
+            "analysis_date": instance.analysis_date,
+            "charts": charts,
+        })
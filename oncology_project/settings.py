@@ -78,6 +78,34 @@ AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_ENDPOINT_URL = env("AWS_S3_ENDPOINT_URL")
 AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME")
+AWS_S3_MAX_POOL_CONNECTIONS = env.int("AWS_S3_MAX_POOL_CONNECTIONS", default=10)
+
+# Number of in-process threads rendering graphics; 0 leaves rendering to "manage.py process_graphics"
+GRAPHIC_WORKERS = env.int("GRAPHIC_WORKERS", default=2)
+# eager - render right after the analysis is saved, lazy - render on the first GET of /graphic/<id>/,
+# off - never render PNGs (clients draw charts from /graphic-data/<id>/)
+GRAPHIC_RENDERING = env("GRAPHIC_RENDERING", default="eager")
+# Seconds a GET of /graphic/<id>/ waits for a render started by a concurrent request in lazy mode
+GRAPHIC_RENDER_TIMEOUT = env.int("GRAPHIC_RENDER_TIMEOUT", default=30)
+# Seconds after which graphics left in "processing" by a dead worker are claimed again
+GRAPHIC_CLAIM_TIMEOUT = env.int("GRAPHIC_CLAIM_TIMEOUT", default=600)
+# Seconds a replaced graphic file is kept in S3 before "manage.py sweep_graphic_files" may delete it
+GRAPHIC_FILES_GRACE_PERIOD = env.int("GRAPHIC_FILES_GRACE_PERIOD", default=3600)
+# Cache key holding the Indicator registry version shared by all processes; empty keeps the registry per process
+INDICATOR_REGISTRY_VERSION_KEY = env("INDICATOR_REGISTRY_VERSION_KEY", default="")
+# Run reference range changes as background jobs instead of inside the PUT request
+CHANGE_REFS_BACKGROUND = env.bool("CHANGE_REFS_BACKGROUND", default=False)
+# Number of in-process threads running those jobs; 0 leaves them to "manage.py process_refs_changes"
+CHANGE_REFS_WORKERS = env.int("CHANGE_REFS_WORKERS", default=1)
+# Seconds without progress after which a "processing" refs change job is claimed again and resumed
+CHANGE_REFS_CLAIM_TIMEOUT = env.int("CHANGE_REFS_CLAIM_TIMEOUT", default=600)
+# Seconds cohort statistics stay cached; new analyses and reference range changes reset them earlier
+COHORT_STATS_CACHE_TIMEOUT = env.int("COHORT_STATS_CACHE_TIMEOUT", default=3600)
+# Default and maximum number of patients per page of /patients-info/
+PATIENTS_PAGE_SIZE = env.int("PATIENTS_PAGE_SIZE", default=50)
+PATIENTS_MAX_PAGE_SIZE = env.int("PATIENTS_MAX_PAGE_SIZE", default=500)
+# Maximum number of patients returned by patient search and autocomplete
+PATIENT_SEARCH_LIMIT = env.int("PATIENT_SEARCH_LIMIT", default=50)
 
 
 MIDDLEWARE = [